@@ -4,25 +4,73 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 
-db = SQLAlchemy()
+from .sessions import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'your_secret_key'
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///forum.db'
+    app.config['POSTS_PER_PAGE'] = 20
+    app.config['METRICS_ENABLED'] = False
+    app.config['SLOW_QUERY_THRESHOLD'] = 0.25
+    app.config['STREAM_COMMENTS_THRESHOLD'] = 200
+    app.config['STREAM_BATCH_SIZE'] = 500
+    app.config['STREAM_CHUNK_SIZE'] = 8192
+    app.config['FEED_TIMELINE_SIZE'] = 500
+    app.config['FEED_FANOUT_LIMIT'] = 10000
+    app.config['FEED_TRIM_EVERY'] = 50
+    app.config.from_prefixed_env()
+    if config:
+        app.config.update(config)
+
+    from . import database
+    database.configure_engine_options(app)
 
     db.init_app(app)
     migrate.init_app(app, db)
+    database.init_app(app)
+
+    from . import instrumentation
+    instrumentation.init_app(app)
+
+    from .replicas import replica_router
+    replica_router.init_app(app)
+
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
 
-    from .models import User
+    from .user_cache import user_cache
+    user_cache.init_app(app)
+
+    from .fragment_cache import fragment_cache
+    fragment_cache.init_app(app)
+
+    from .live import live_updates
+    live_updates.init_app(app)
+
+    from .assets import assets
+    assets.init_app(app)
+
+    from .passwords import password_hasher
+    password_hasher.init_app(app)
+
+    from .latest import latest_posts
+    latest_posts.init_app(app)
+
+    from .jobs import job_queue
+    job_queue.init_app(app)
+
+    from . import compression
+    compression.init_app(app)
 
     @login_manager.user_loader
+    @instrumentation.timed('load_user')
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load(int(user_id))
 
     from .auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint)
@@ -31,7 +79,11 @@ def create_app():
     app.register_blueprint(main_blueprint)
 
     from .forum import forum as forum_blueprint
+    from . import commands
     app.register_blueprint(forum_blueprint)
 
+    from .api import api as api_blueprint
+    app.register_blueprint(api_blueprint)
+
     return app
 
@@ -0,0 +1,155 @@
+import hashlib
+
+from flask import Blueprint, current_app, jsonify, make_response, request, url_for
+
+from .instrumentation import query_budget
+from .models import db, Team, Post, Comment
+from .pagination import keyset_page
+from .replicas import replica_reads
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Bump when the shape of a payload changes so clients holding an old ETag
+# get the new representation.
+API_VERSION = 1
+
+
+@api.route('/teams')
+@replica_reads
+@query_budget(1)
+def list_teams():
+    # The list is small, so the validator is taken over every field it
+    # shows; a renamed team changes the ETag as well as a new one.
+    teams = db.session.execute(db.select(Team.id, Team.name, Team.description).order_by(Team.name)).all()
+    etag = make_etag('teams', [tuple(team) for team in teams])
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    return json_response({'teams': [team_json(team) for team in teams]}, etag)
+
+
+@api.route('/teams/<int:team_id>/posts')
+@replica_reads
+@query_budget(3)
+def team_posts(team_id):
+    team = Team.query.get_or_404(team_id)
+    sort = 'hot' if request.args.get('sort') == 'hot' else 'new'
+    before = request.args.get('before')
+
+    # Read the page's keys and counters first, without titles or bodies;
+    # they are enough to validate the client's copy.
+    keys, next_cursor = keyset_page(
+        db.session.query(Post.id, Post.timestamp, Post.hot_score, Post.vote_score, Post.comment_count)
+        .filter(Post.team_id == team_id),
+        Post.hot_score if sort == 'hot' else Post.timestamp,
+        Post.id,
+        before=before,
+        per_page=current_app.config['POSTS_PER_PAGE'],
+    )
+    etag = make_etag('team_posts', team_id, sort, next_cursor, [tuple(row) for row in keys])
+    last_modified = max((row.timestamp for row in keys), default=None)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag, last_modified)
+
+    posts = {}
+    if keys:
+        ids = [row.id for row in keys]
+        posts = {post.id: post for post in Post.query.options(db.joinedload(Post.author)).filter(Post.id.in_(ids))}
+    return json_response({
+        'team': team_json(team),
+        'sort': sort,
+        'posts': [post_json(posts[row.id]) for row in keys if row.id in posts],
+        'next': url_for('api.team_posts', team_id=team_id, sort=sort, before=next_cursor) if next_cursor else None,
+    }, etag, last_modified)
+
+
+@api.route('/teams/<int:team_id>/posts/<int:post_id>')
+@replica_reads
+@query_budget(3)
+def post_detail(team_id, post_id):
+    post = (
+        Post.query.options(db.joinedload(Post.author))
+        .filter_by(id=post_id, team_id=team_id)
+        .first_or_404()
+    )
+    # comment_count moves with every new comment; the score total catches
+    # votes on comments.
+    comment_votes, last_comment = (
+        db.session.query(db.func.coalesce(db.func.sum(Comment.vote_score), 0), db.func.max(Comment.timestamp))
+        .filter(Comment.post_id == post_id)
+        .one()
+    )
+    etag = make_etag('post', post.id, post.vote_score, post.comment_count, comment_votes, last_comment)
+    last_modified = max(filter(None, (post.timestamp, last_comment)), default=None)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag, last_modified)
+
+    comments = (
+        Comment.query.options(db.joinedload(Comment.author))
+        .filter_by(post_id=post_id)
+        .order_by(Comment.timestamp.asc(), Comment.id.asc())
+        .all()
+    )
+    payload = post_json(post)
+    payload['content'] = post.content
+    payload['comments'] = [comment_json(comment) for comment in comments]
+    return json_response(payload, etag, last_modified)
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr((API_VERSION,) + parts).encode()).hexdigest()
+
+
+def not_modified(etag, last_modified=None):
+    response = make_response('', 304)
+    return _validators(response, etag, last_modified)
+
+
+def json_response(payload, etag, last_modified=None):
+    return _validators(jsonify(payload), etag, last_modified)
+
+
+def _validators(response, etag, last_modified):
+    # Clients revalidate on every poll; only If-None-Match is honoured, since
+    # votes change a resource without moving any timestamp.
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def _timestamp(value):
+    return value.isoformat() + 'Z' if value else None
+
+
+def team_json(team):
+    return {
+        'id': team.id,
+        'name': team.name,
+        'description': team.description,
+        'url': url_for('api.team_posts', team_id=team.id),
+    }
+
+
+def post_json(post):
+    return {
+        'id': post.id,
+        'team_id': post.team_id,
+        'title': post.title,
+        'author': post.author.username,
+        'timestamp': _timestamp(post.timestamp),
+        'vote_score': post.vote_score,
+        'comment_count': post.comment_count,
+        'url': url_for('api.post_detail', team_id=post.team_id, post_id=post.id),
+    }
+
+
+def comment_json(comment):
+    return {
+        'id': comment.id,
+        'author': comment.author.username,
+        'content': comment.content,
+        'timestamp': _timestamp(comment.timestamp),
+        'vote_score': comment.vote_score,
+    }
@@ -0,0 +1,141 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db
+from .feed import rebuild_feeds
+from .models import User, Team, TeamFollow, Post, Comment, PostVote, CommentVote, rebuild_counters, rebuild_team_stats
+from .ranking import HOT_WINDOW, refresh_hot_scores
+from .search import rebuild_search_index
+
+# Parents before children, so an archive can be imported front to back.
+TABLES = (
+    ('user', User),
+    ('team', Team),
+    ('team_follow', TeamFollow),
+    ('post', Post),
+    ('comment', Comment),
+    ('post_vote', PostVote),
+    ('comment_vote', CommentVote),
+)
+REPORT_EVERY = 100000
+
+
+def export_archive(out, batch_size=5000, log=print):
+    # Writes one JSON object per line, tagged with its "type". Rows are read
+    # in primary key order a batch at a time, so memory stays flat however
+    # big the tables are.
+    counts = {}
+    for kind, model in TABLES:
+        table = model.__table__
+        key = list(table.primary_key.columns)
+        last_key = None
+        count = 0
+        while True:
+            statement = db.select(table).order_by(*key).limit(batch_size)
+            if last_key is not None:
+                statement = statement.where(db.tuple_(*key) > db.tuple_(*last_key))
+            rows = db.session.execute(statement).mappings().all()
+            if not rows:
+                break
+            for row in rows:
+                out.write(json.dumps({'type': kind, **row}, default=_encode) + '\n')
+            last_key = [rows[-1][column.name] for column in key]
+            count += len(rows)
+        counts[kind] = count
+        log(f'{table.name}: {count} rows')
+    return counts
+
+
+def import_archive(lines, batch_size=5000, checkpoint=None, log=print):
+    # Inserts rows with executemany, one commit per batch. After each commit
+    # the number of lines consumed is written to `checkpoint`; a rerun with
+    # the same file skips those lines. Rows whose id already exists are
+    # ignored, so replaying a partial batch is harmless.
+    models = dict(TABLES)
+    datetimes = {
+        kind: [column.name for column in model.__table__.columns if isinstance(column.type, db.DateTime)]
+        for kind, model in TABLES
+    }
+    skip = _read_checkpoint(checkpoint)
+    if skip:
+        log(f'Resuming after line {skip}.')
+
+    counts = {kind: 0 for kind, _ in TABLES}
+    batch = []
+    batch_kind = None
+    start = time.perf_counter()
+    report_at = REPORT_EVERY
+
+    def flush(last_line):
+        nonlocal report_at
+        db.session.execute(sqlite_insert(models[batch_kind]).on_conflict_do_nothing(), batch)
+        db.session.commit()
+        counts[batch_kind] += len(batch)
+        _write_checkpoint(checkpoint, last_line)
+        total = sum(counts.values())
+        if total >= report_at:
+            log(f'  {total} rows, {_rate(total, start)} rows/s')
+            report_at = total + REPORT_EVERY
+
+    line_number = 0
+    for line_number, line in enumerate(lines, 1):
+        if line_number <= skip or not line.strip():
+            continue
+        row = json.loads(line)
+        kind = row.pop('type')
+        if kind not in models:
+            raise ValueError(f'line {line_number}: unknown row type {kind!r}')
+        for name in datetimes[kind]:
+            if row.get(name) is not None:
+                row[name] = datetime.fromisoformat(row[name])
+
+        if batch and (kind != batch_kind or len(batch) >= batch_size):
+            flush(line_number - 1)
+            batch = []
+        batch_kind = kind
+        batch.append(row)
+    if batch:
+        flush(line_number)
+
+    total = sum(counts.values())
+    log(f'Imported {total} rows in {time.perf_counter() - start:.1f}s ({_rate(total, start)} rows/s).')
+
+    log('Rebuilding counters, team stats, feeds, hot scores and the search index...')
+    rebuild_counters()
+    rebuild_team_stats()
+    rebuild_feeds()
+    db.session.commit()
+    refresh_hot_scores(window=HOT_WINDOW, batch_size=batch_size)
+    rebuild_search_index()
+    db.session.commit()
+    return counts
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _rate(rows, start):
+    elapsed = time.perf_counter() - start
+    return round(rows / elapsed) if elapsed else 0
+
+
+def _read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return int(f.read().strip() or 0)
+
+
+def _write_checkpoint(path, line_number):
+    if not path:
+        return
+    with open(path + '.tmp', 'w') as f:
+        f.write(str(line_number))
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,269 @@
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import abort, request, url_for
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from . import db
+from .api import comment_json, json_response, make_etag, not_modified, post_json, team_json
+from .live import HubFull, live_updates
+from .models import Team, Post, Comment
+from .pagination import keyset_filter, keyset_split
+
+
+class AsyncForum:
+    # ASGI entry point. The JSON reads and live event streams, which are the
+    # bulk of match-day traffic and hold connections longest, run as native
+    # coroutines on aiosqlite; every other route goes through the WSGI app on
+    # a pool of ASGI_WSGI_THREADS threads.
+
+    def __init__(self, app):
+        self.app = app
+        app.config.setdefault('ASGI_WSGI_THREADS', 32)
+        self.executor = ThreadPoolExecutor(app.config['ASGI_WSGI_THREADS'], thread_name_prefix='wsgi')
+        self.wsgi = PooledWsgiToAsgi(app, self.executor)
+        with app.app_context():
+            url = app.config.get('ASYNC_DATABASE_URI') or db.engine.url.set(drivername='sqlite+aiosqlite')
+        self.engine = create_async_engine(url)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.routes = [
+            (re.compile(r'/api/v1/teams'), self.list_teams),
+            (re.compile(r'/api/v1/teams/(?P<team_id>\d+)/posts'), self.team_posts),
+            (re.compile(r'/api/v1/teams/(?P<team_id>\d+)/posts/(?P<post_id>\d+)'), self.post_detail),
+        ]
+        self.streams = re.compile(r'/teams/(?P<team_id>\d+)/post/(?P<post_id>\d+)/events')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            path = scope['path']
+            for pattern, view in self.routes:
+                match = pattern.fullmatch(path)
+                if match:
+                    return await self.respond(scope, send, view, **_ints(match))
+            match = self.streams.fullmatch(path)
+            if match and live_updates.enabled and hasattr(live_updates.hub, 'subscribe_async'):
+                return await self.post_events(scope, receive, send, **_ints(match))
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def respond(self, scope, send, view, **kwargs):
+        # Views run inside a Flask request context built from the ASGI scope,
+        # so url_for, request.args and request.if_none_match work as usual.
+        with self._request_context(scope):
+            try:
+                response = await view(**kwargs)
+            except HTTPException as exc:
+                response = exc.get_response()
+            body = b'' if scope['method'] == 'HEAD' else response.get_data()
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response.headers.items()],
+            })
+            await send({'type': 'http.response.body', 'body': body})
+
+    async def list_teams(self):
+        async with self.sessions() as session:
+            teams = (await session.execute(
+                db.select(Team.id, Team.name, Team.description).order_by(Team.name)
+            )).all()
+            etag = make_etag('teams', [tuple(team) for team in teams])
+            if request.if_none_match.contains_weak(etag):
+                return not_modified(etag)
+
+            return json_response({'teams': [team_json(team) for team in teams]}, etag)
+
+    async def team_posts(self, team_id):
+        sort = 'hot' if request.args.get('sort') == 'hot' else 'new'
+        key_column = Post.hot_score if sort == 'hot' else Post.timestamp
+        per_page = self.app.config['POSTS_PER_PAGE']
+
+        async with self.sessions() as session:
+            team = await session.get(Team, team_id)
+            if team is None:
+                abort(404)
+            statement = keyset_filter(
+                db.select(Post.id, Post.timestamp, Post.hot_score, Post.vote_score, Post.comment_count)
+                .where(Post.team_id == team_id),
+                key_column, Post.id, before=request.args.get('before'), per_page=per_page,
+            )
+            keys, next_cursor = keyset_split((await session.execute(statement)).all(), key_column, Post.id, per_page)
+            etag = make_etag('team_posts', team_id, sort, next_cursor, [tuple(row) for row in keys])
+            last_modified = max((row.timestamp for row in keys), default=None)
+            if request.if_none_match.contains_weak(etag):
+                return not_modified(etag, last_modified)
+
+            posts = {}
+            if keys:
+                result = await session.scalars(
+                    db.select(Post).options(db.joinedload(Post.author)).where(Post.id.in_([row.id for row in keys]))
+                )
+                posts = {post.id: post for post in result}
+            return json_response({
+                'team': team_json(team),
+                'sort': sort,
+                'posts': [post_json(posts[row.id]) for row in keys if row.id in posts],
+                'next': url_for('api.team_posts', team_id=team_id, sort=sort, before=next_cursor) if next_cursor else None,
+            }, etag, last_modified)
+
+    async def post_detail(self, team_id, post_id):
+        async with self.sessions() as session:
+            post = await session.scalar(
+                db.select(Post).options(db.joinedload(Post.author)).where(Post.id == post_id, Post.team_id == team_id)
+            )
+            if post is None:
+                abort(404)
+            comment_votes, last_comment = (await session.execute(
+                db.select(db.func.coalesce(db.func.sum(Comment.vote_score), 0), db.func.max(Comment.timestamp))
+                .where(Comment.post_id == post_id)
+            )).one()
+            etag = make_etag('post', post.id, post.vote_score, post.comment_count, comment_votes, last_comment)
+            last_modified = max(filter(None, (post.timestamp, last_comment)), default=None)
+            if request.if_none_match.contains_weak(etag):
+                return not_modified(etag, last_modified)
+
+            comments = (await session.scalars(
+                db.select(Comment).options(db.joinedload(Comment.author))
+                .where(Comment.post_id == post_id)
+                .order_by(Comment.timestamp.asc(), Comment.id.asc())
+            )).all()
+            payload = post_json(post)
+            payload['content'] = post.content
+            payload['comments'] = [comment_json(comment) for comment in comments]
+            return json_response(payload, etag, last_modified)
+
+    async def post_events(self, scope, receive, send, team_id, post_id):
+        async with self.sessions() as session:
+            found = await session.scalar(db.select(Post.team_id).where(Post.id == post_id))
+        if found != team_id:
+            return await _plain(send, 404, b'Not Found')
+        try:
+            stream = live_updates.stream_async(f'post:{post_id}')
+        except HubFull:
+            return await _plain(send, 503, b'Too many live connections.', [(b'retry-after', b'30')])
+
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream; charset=utf-8'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            async for chunk in stream:
+                if disconnected.done():
+                    break
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            await stream.close()
+
+    def _request_context(self, scope):
+        headers = [(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']]
+        host = next((v for k, v in headers if k.lower() == 'host'), 'localhost')
+        return self.app.test_request_context(
+            scope['path'],
+            base_url=f"{scope.get('scheme', 'http')}://{host}{scope.get('root_path', '')}",
+            query_string=scope['query_string'].decode('latin-1'),
+            method=scope['method'],
+            headers=headers,
+        )
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    # asgiref runs the WSGI app with sync_to_async's default
+    # thread_sensitive=True, i.e. on one shared thread per process, one
+    # request at a time: a slow client on a streamed page would hold up
+    # everyone. Run each request on its own thread from `executor` instead.
+
+    def __init__(self, wsgi_application, executor, duplicate_header_limit=100):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        instance = PooledWsgiInstance(self.wsgi_application, self.executor, self.duplicate_header_limit)
+        await instance(scope, receive, send)
+
+
+class PooledWsgiInstance(WsgiToAsgiInstance):
+    # Reuses asgiref's environ and start_response handling; only the call
+    # into the WSGI app is ours, so it can go to the pool.
+
+    def __init__(self, wsgi_application, executor, duplicate_header_limit=100):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(self.call_wsgi_app, thread_sensitive=False, executor=self.executor)(body)
+
+    def call_wsgi_app(self, body):
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:
+            # Too many duplicate headers.
+            self.sync_send({'type': 'http.response.start', 'status': 400,
+                            'headers': [(b'content-type', b'text/plain')]})
+            self.sync_send({'type': 'http.response.body', 'body': b'Bad Request'})
+            return
+
+        sent = 0
+        output = self.wsgi_application(environ, self.start_response)
+        try:
+            for chunk in output:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                # Never send more than a Content-Length the app declared.
+                if self.response_content_length is not None:
+                    chunk = chunk[:self.response_content_length - sent]
+                self.sync_send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                sent += len(chunk)
+                if sent == self.response_content_length:
+                    break
+        finally:
+            if hasattr(output, 'close'):
+                output.close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({'type': 'http.response.body'})
+
+
+def _ints(match):
+    return {key: int(value) for key, value in match.groupdict().items()}
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _plain(send, status, body, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8'), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
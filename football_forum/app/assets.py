@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BUILD_DIR = 'dist'
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+ONE_YEAR = 365 * 24 * 3600
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_CSS_URL_RE = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def build_assets(static_folder, log=print):
+    # Copies every static file to dist/ under a content-hashed name, writes
+    # .gz (and .br when the brotli package is installed) next to text assets,
+    # and records the mapping in dist/manifest.json. CSS is built last so
+    # its url() references can point at the hashed fonts and images.
+    build_dir = os.path.join(static_folder, BUILD_DIR)
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != build_dir)
+        for name in sorted(files):
+            sources.append(os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/'))
+    sources.sort(key=lambda path: path.endswith('.css'))
+
+    files = {}
+    encodings = {}
+    for source in sources:
+        with open(os.path.join(static_folder, source), 'rb') as f:
+            content = f.read()
+        if source.endswith('.css'):
+            content = _rewrite_css_urls(content.decode('utf-8'), source, files).encode('utf-8')
+
+        stem, ext = os.path.splitext(source)
+        target = f'{BUILD_DIR}/{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+        _write(static_folder, target, content)
+        files[source] = target
+
+        if ext in COMPRESSIBLE:
+            available = []
+            if brotli is not None:
+                _write(static_folder, target + '.br', brotli.compress(content, quality=11))
+                available.append('br')
+            _write(static_folder, target + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+            available.append('gzip')
+            encodings[target] = available
+        log(f'{source} -> {target}')
+
+    if brotli is None:
+        log('brotli is not installed; wrote gzip variants only.')
+    with open(os.path.join(build_dir, 'manifest.json'), 'w') as f:
+        json.dump({'files': files, 'encodings': encodings}, f, indent=2, sort_keys=True)
+    return files
+
+
+def _rewrite_css_urls(css, source, files):
+    base = os.path.dirname(source)
+
+    def replace(match):
+        quote, url = match.groups()
+        if ':' in url or url.startswith(('/', '#')):
+            return match.group(0)
+        resolved = os.path.normpath(os.path.join(base, url.partition('?')[0])).replace(os.sep, '/')
+        if resolved not in files:
+            return match.group(0)
+        # Hashed files all live under dist/, mirroring the source layout.
+        relative = os.path.relpath(files[resolved], f'{BUILD_DIR}/{base}' if base else BUILD_DIR)
+        return f'url({quote}{relative.replace(os.sep, "/")}{quote})'
+
+    return _CSS_URL_RE.sub(replace, css)
+
+
+def _write(static_folder, path, content):
+    full = os.path.join(static_folder, path)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    with open(full, 'wb') as f:
+        f.write(content)
+
+
+class Assets:
+    # Points url_for('static', filename=...) at the hashed build when a
+    # manifest exists, and serves the build with far-future immutable caching
+    # and precompressed variants. Without a build, static files are served
+    # as before.
+
+    def __init__(self):
+        self.files = {}
+        self.encodings = {}
+
+    def init_app(self, app):
+        app.config.setdefault(
+            'ASSETS_MANIFEST', os.path.join(app.static_folder, BUILD_DIR, 'manifest.json')
+        )
+        self.load(app.config['ASSETS_MANIFEST'])
+        app.url_defaults(self.url_defaults)
+        app.view_functions['static'] = self.send_static
+
+    def load(self, path):
+        self.files = {}
+        self.encodings = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+            self.files = manifest['files']
+            self.encodings = manifest['encodings']
+
+    def url_defaults(self, endpoint, values):
+        if endpoint == 'static':
+            filename = values.get('filename')
+            if filename in self.files:
+                values['filename'] = self.files[filename]
+
+    def send_static(self, filename):
+        if not filename.startswith(BUILD_DIR + '/'):
+            return current_app.send_static_file(filename)
+
+        available = self.encodings.get(filename, ())
+        mimetype = mimetypes.guess_type(filename)[0]
+        for encoding, suffix in ENCODINGS:
+            if encoding in available and request.accept_encodings[encoding]:
+                response = send_from_directory(
+                    current_app.static_folder, filename + suffix, mimetype=mimetype, max_age=ONE_YEAR
+                )
+                response.content_encoding = encoding
+                break
+        else:
+            response = send_from_directory(current_app.static_folder, filename, mimetype=mimetype, max_age=ONE_YEAR)
+        if available:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.immutable = True
+        return response
+
+
+assets = Assets()
@@ -1,10 +1,16 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 from .models import db, User
+from .passwords import HasherBusy, password_hasher
 
 auth = Blueprint('auth', __name__)
 
+
+@auth.errorhandler(HasherBusy)
+def hasher_busy(error):
+    return 'Too many sign-ins right now. Please try again in a moment.', 503, {'Retry-After': '2'}
+
+
 @auth.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
@@ -26,7 +32,7 @@ def register():
         new_user = User(
             username=username,
             email=email,
-            password=generate_password_hash(password, method='pbkdf2:sha256')
+            password=password_hasher.hash(password)
         )
         db.session.add(new_user)
         db.session.commit()
@@ -47,10 +53,17 @@ def login():
         password = request.form.get('password')
 
         user = User.query.filter_by(username=username).first()
-        if not user or not check_password_hash(user.password, password):
+        if not user or not password_hasher.verify(user.password, password):
             flash('Invalid username or password.', 'error')
             return redirect(url_for('auth.login'))
 
+        if password_hasher.needs_rehash(user.password):
+            try:
+                user.password = password_hasher.hash(password)
+                db.session.commit()
+            except HasherBusy:
+                pass
+
         login_user(user)
         flash('Logged in successfully!', 'success')
         return redirect(url_for('main.dashboard'))
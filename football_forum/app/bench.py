@@ -0,0 +1,303 @@
+import json
+import queue
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.client import HTTPConnection
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, build_opener
+
+from . import db
+from .models import User, Post, Comment
+from .seed import SEED_PASSWORD
+
+ROUTES = ('list_teams', 'team_posts', 'post_detail', 'api_team_posts', 'api_post_detail', 'upvote_post', 'login')
+LOGIN_LEVELS = (0, 2, 4, 8, 16)
+
+
+class TestClientDriver:
+    def __init__(self, app):
+        self.app = app
+
+    def session(self, login=None):
+        client = self.app.test_client()
+        if login is not None:
+            with client.session_transaction() as session:
+                session['_user_id'] = str(login[0])
+                session['_fresh'] = True
+        return client
+
+    def request(self, client, method, path, data=None):
+        return client.open(path, method=method, data=data).status_code
+
+
+class HTTPDriver:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def session(self, login=None):
+        opener = build_opener(HTTPCookieProcessor(CookieJar()), _NoRedirect())
+        if login is not None:
+            self.request(opener, 'POST', '/login', {'username': login[1], 'password': SEED_PASSWORD})
+        return opener
+
+    def request(self, opener, method, path, data=None):
+        body = urlencode(data).encode() if data is not None else None
+        try:
+            with opener.open(self.base_url + path, data=body, timeout=30) as response:
+                response.read()
+                return response.status
+        except HTTPError as error:
+            return error.code
+
+
+def run_benchmark(app, routes=ROUTES, requests=200, concurrency=8, base_url=None, seed=42, streams=0):
+    rng = random.Random(seed)
+    users, posts, busiest = _sample(app)
+    if streams and not base_url:
+        raise ValueError('Holding event streams open needs a running server; pass --url.')
+    driver = HTTPDriver(base_url) if base_url else TestClientDriver(app)
+
+    # Idle live-update streams, as open thread pages hold them, occupying the
+    # server while the routes are measured.
+    held = _open_streams(base_url, [rng.choice(busiest) for _ in range(streams)])
+    results = {}
+    try:
+        for route in routes:
+            plan = [_plan(route, rng, users, posts, busiest) for _ in range(requests)]
+            logins = rng.sample(users, min(concurrency, len(users)))
+            results[route] = _measure(driver, plan, concurrency, logins)
+    finally:
+        for conn in held:
+            conn.close()
+
+    return {
+        'commit': _git_commit(),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'mode': 'http' if base_url else 'test-client',
+        'base_url': base_url,
+        'requests_per_route': requests,
+        'concurrency': concurrency,
+        'streams_requested': streams,
+        'streams_open': len(held),
+        'seed': seed,
+        'routes': results,
+    }
+
+
+def run_login_benchmark(app, levels=LOGIN_LEVELS, readers=4, duration=5.0, base_url=None, seed=42):
+    # For each level, `level` clients log in back to back while `readers`
+    # clients browse team boards; shows how login load spills into reads.
+    rng = random.Random(seed)
+    users, posts, busiest = _sample(app)
+    driver = HTTPDriver(base_url) if base_url else TestClientDriver(app)
+    results = []
+    for level in levels:
+        read_steps = _steps(lambda: _plan('team_posts', rng, users, posts, busiest))
+        login_steps = _steps(lambda: _plan('login', rng, users, posts, busiest))
+        deadline = time.perf_counter() + duration
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            reads = executor.submit(_soak, driver, read_steps, readers, deadline)
+            logins = executor.submit(_soak, driver, login_steps, level, deadline) if level else None
+            results.append({
+                'login_concurrency': level,
+                'reads': reads.result(),
+                'logins': logins.result() if logins else None,
+            })
+
+    return {
+        'commit': _git_commit(),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'mode': 'http' if base_url else 'test-client',
+        'base_url': base_url,
+        'readers': readers,
+        'duration_s': duration,
+        'seed': seed,
+        'levels': results,
+    }
+
+
+def _sample(app):
+    with app.app_context():
+        users = [tuple(row) for row in db.session.query(User.id, User.username).order_by(User.id.desc()).limit(500)]
+        posts = [tuple(row) for row in db.session.query(Post.id, Post.team_id).order_by(Post.id.desc()).limit(2000)]
+        busiest = (
+            db.session.query(Comment.post_id, Post.team_id)
+            .join(Post, Post.id == Comment.post_id)
+            .group_by(Comment.post_id, Post.team_id)
+            .order_by(db.func.count().desc())
+            .limit(20)
+            .all()
+        )
+    if not users or not posts:
+        raise ValueError('Benchmarks need users and posts; run `flask forum seed` first.')
+    return users, posts, [tuple(row) for row in busiest] or posts
+
+
+def _plan(route, rng, users, posts, busiest):
+    # Steps are (session kind, method, path, form data). 'user' steps run on a
+    # logged-in session, 'fresh' steps on a new anonymous one.
+    post_id, team_id = rng.choice(posts)
+    if route == 'list_teams':
+        return 'anonymous', 'GET', '/teams/', None
+    if route == 'team_posts':
+        return 'anonymous', 'GET', f'/teams/{team_id}', None
+    if route == 'post_detail':
+        post_id, team_id = rng.choice(busiest)
+        return 'anonymous', 'GET', f'/teams/{team_id}/post/{post_id}', None
+    if route == 'api_team_posts':
+        return 'anonymous', 'GET', f'/api/v1/teams/{team_id}/posts', None
+    if route == 'api_post_detail':
+        post_id, team_id = rng.choice(busiest)
+        return 'anonymous', 'GET', f'/api/v1/teams/{team_id}/posts/{post_id}', None
+    if route == 'upvote_post':
+        return 'user', 'POST', f'/teams/{team_id}/post/{post_id}/upvote', None
+    if route == 'login':
+        username = rng.choice(users)[1]
+        return 'fresh', 'POST', '/login', {'username': username, 'password': SEED_PASSWORD}
+    raise ValueError(f'Unknown route {route!r}; choose from {", ".join(ROUTES)}')
+
+
+def _open_streams(base_url, targets):
+    if not targets:
+        return []
+    url = urlsplit(base_url)
+
+    def open_stream(target):
+        post_id, team_id = target
+        conn = HTTPConnection(url.hostname, url.port or 80, timeout=5)
+        try:
+            conn.request('GET', f'{url.path.rstrip("/")}/teams/{team_id}/post/{post_id}/events')
+            if conn.getresponse().status == 200:
+                return conn
+        except OSError:
+            pass
+        conn.close()
+        return None
+
+    with ThreadPoolExecutor(max_workers=min(len(targets), 64)) as executor:
+        return [conn for conn in executor.map(open_stream, targets) if conn is not None]
+
+
+def _measure(driver, plan, concurrency, logins):
+    # Sessions are created (and logged in) before the clock starts, so the
+    # numbers cover only the requests under test.
+    pools = {}
+    kinds = {step[0] for step in plan}
+    if 'anonymous' in kinds:
+        pools['anonymous'] = queue.Queue()
+        for _ in range(concurrency):
+            pools['anonymous'].put(driver.session())
+    if 'user' in kinds:
+        pools['user'] = queue.Queue()
+        for login in logins:
+            pools['user'].put(driver.session(login))
+
+    tally = _Tally()
+
+    def run(step):
+        kind, method, path, data = step
+        pool = pools.get(kind)
+        session = pool.get() if pool else driver.session()
+        tally.request(driver, session, method, path, data)
+        if pool:
+            pool.put(session)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run, plan))
+    return tally.summary(time.perf_counter() - start)
+
+
+def _steps(make_step):
+    lock = threading.Lock()
+
+    def next_step():
+        with lock:
+            return make_step()
+
+    return next_step
+
+
+def _soak(driver, next_step, concurrency, deadline):
+    # Like _measure, but each client keeps issuing requests until `deadline`.
+    sessions = [driver.session() for _ in range(concurrency)]
+    tally = _Tally()
+
+    def run(session):
+        while time.perf_counter() < deadline:
+            kind, method, path, data = next_step()
+            tally.request(driver, driver.session() if kind == 'fresh' else session, method, path, data)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run, sessions))
+    return tally.summary(time.perf_counter() - start)
+
+
+class _Tally:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.rejected = 0
+
+    def request(self, driver, session, method, path, data):
+        start = time.perf_counter()
+        try:
+            status = driver.request(session, method, path, data)
+        except Exception:
+            status = None
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            self.latencies.append(elapsed)
+            if status == 503:
+                self.rejected += 1
+            elif status is None or status >= 500:
+                self.errors += 1
+
+    def summary(self, wall):
+        latencies = sorted(self.latencies)
+        return {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+            'p50_ms': _percentile(latencies, 50),
+            'p95_ms': _percentile(latencies, 95),
+            'p99_ms': _percentile(latencies, 99),
+            'max_ms': round(latencies[-1] * 1000, 3) if latencies else None,
+        }
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[index] * 1000, 3)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
@@ -0,0 +1,270 @@
+import gzip
+import os
+import threading
+import time
+from datetime import timedelta
+
+import click
+from flask import current_app
+
+from .archive import export_archive, import_archive
+from .assets import build_assets
+from .bench import LOGIN_LEVELS, ROUTES, run_benchmark, run_login_benchmark, write_results
+from .forum import forum
+from .fragment_cache import fragment_cache
+from .jobs import job_queue
+from .moderation import purge
+from .models import db, User, Team, rebuild_counters, rebuild_team_stats
+from .ranking import HOT_WINDOW, refresh_hot_scores
+from .replicas import replica_router, sync_replica
+from .search import rebuild_search_index
+from .seed import SEED_PASSWORD, seed_database
+
+
+@forum.cli.command('rebuild-scores')
+def rebuild_scores_command():
+    """Recompute stored scores and comment counts from the source tables."""
+    posts, comments = rebuild_counters()
+    db.session.commit()
+    click.echo(f'Recomputed counters for {posts} posts and {comments} comments.')
+
+
+@forum.cli.command('rebuild-team-stats')
+def rebuild_team_stats_command():
+    """Recompute per-team post and comment totals for the teams index."""
+    teams = rebuild_team_stats()
+    db.session.commit()
+    fragment_cache.invalidate('teams')
+    click.echo(f'Recomputed stats for {teams} teams.')
+
+
+@forum.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Create the full-text index if needed and repopulate it from posts and comments."""
+    posts, comments = rebuild_search_index()
+    db.session.commit()
+    click.echo(f'Indexed {posts} posts and {comments} comments.')
+
+
+@forum.cli.command('refresh-hot')
+@click.option('--window-days', default=HOT_WINDOW.days, show_default=True,
+              help='Recompute posts created within this many days; older ones drop to 0.')
+@click.option('--batch-size', default=1000, show_default=True)
+def refresh_hot_command(window_days, batch_size):
+    """Apply time decay to hot scores; run periodically (e.g. from cron)."""
+    updated = refresh_hot_scores(timedelta(days=window_days), batch_size=batch_size)
+    fragment_cache.invalidate(*[f'team:{team_id}:hot' for team_id, in db.session.query(Team.id)])
+    click.echo(f'Refreshed hot scores for {updated} posts.')
+
+
+@forum.cli.command('seed')
+@click.option('--users', default=1000, show_default=True)
+@click.option('--teams', default=20, show_default=True)
+@click.option('--posts', default=10000, show_default=True)
+@click.option('--comments', default=50000, show_default=True)
+@click.option('--votes', default=100000, show_default=True, help='Split evenly between posts and comments.')
+@click.option('--seed', default=42, show_default=True, help='Random seed; same seed, same data.')
+@click.option('--batch-size', default=5000, show_default=True)
+def seed_command(users, teams, posts, comments, votes, seed, batch_size):
+    """Fill the database with deterministic synthetic forum data."""
+    if posts and not (users and teams):
+        raise click.BadParameter('posts need at least one user and one team')
+    if (comments or votes) and not posts:
+        raise click.BadParameter('comments and votes need at least one post')
+
+    start = time.perf_counter()
+    seed_database(users, teams, posts, comments, votes, seed=seed, batch_size=batch_size, log=click.echo)
+    click.echo(f'Seeded in {time.perf_counter() - start:.1f}s. Seeded users log in with password "{SEED_PASSWORD}".')
+
+
+@forum.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint and precompress static files into static/dist."""
+    files = build_assets(current_app.static_folder, log=click.echo)
+    click.echo(f'Built {len(files)} assets; restart the app to serve them.')
+
+
+@forum.cli.command('worker')
+@click.option('--threads', default=2, show_default=True, help='Worker threads in this process.')
+@click.option('--batch-size', default=100, show_default=True, help='Most jobs of one kind run per transaction.')
+@click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to wait when nothing is ready.')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty.')
+@click.option('--verbose', is_flag=True, help='Print every batch.')
+def worker_command(threads, batch_size, poll_interval, burst, verbose):
+    """Run queued background jobs (search indexing, feed fan-out)."""
+    app = current_app._get_current_object()
+    stop = threading.Event()
+    workers = [
+        threading.Thread(
+            target=job_queue.work, args=(app, stop), daemon=True,
+            kwargs={'batch_size': batch_size, 'poll_interval': poll_interval, 'burst': burst,
+                    'log': click.echo if verbose else None},
+        )
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(0.5)
+    except KeyboardInterrupt:
+        stop.set()
+        for worker in workers:
+            worker.join()
+    done = sum(job_queue.done.values())
+    failed = sum(job_queue.failed.values())
+    click.echo(f'Ran {done} jobs; {failed} failed for good.')
+
+
+@forum.cli.command('sync-replicas')
+@click.option('--every', default=0.0, help='Keep syncing, every this many seconds.')
+def sync_replicas_command(every):
+    """Copy the primary database into each file-backed read replica."""
+    if not replica_router.replicas:
+        raise click.ClickException('No DATABASE_REPLICAS configured.')
+    while True:
+        for key in replica_router.replicas:
+            start = time.perf_counter()
+            sync_replica(db.engine, db.engines[key])
+            click.echo(f'{key}: synced in {time.perf_counter() - start:.2f}s')
+        if not every:
+            break
+        time.sleep(every)
+
+
+@forum.cli.command('purge')
+@click.option('--user', 'username', help='Delete everything this user posted, commented and voted.')
+@click.option('--since', type=click.DateTime(), help='Only content created at or after this time (UTC).')
+@click.option('--until', type=click.DateTime(), help='Only content created before this time (UTC).')
+@click.option('--batch-size', default=500, show_default=True, help='Rows deleted per transaction.')
+@click.option('--pause', default=0.1, show_default=True, help='Seconds to yield the write lock between batches.')
+def purge_command(username, since, until, batch_size, pause):
+    """Bulk-delete spam by user and/or date range in small transactions."""
+    if not (username or since or until):
+        raise click.UsageError('Give --user, --since or --until.')
+    user_id = None
+    if username:
+        user_id = db.session.query(User.id).filter_by(username=username).scalar()
+        if user_id is None:
+            raise click.BadParameter(f'no user named {username!r}', param_hint='--user')
+
+    start = time.perf_counter()
+    counts = purge(user_id, since, until, batch_size=batch_size, pause=pause, log=click.echo)
+    click.echo(f'Deleted {sum(counts.values())} rows in {time.perf_counter() - start:.1f}s.')
+
+
+@forum.cli.command('moderator')
+@click.argument('username')
+@click.option('--revoke', is_flag=True, help='Take moderator rights away instead.')
+def moderator_command(username, revoke):
+    """Grant a user moderator rights (delete posts, lock threads)."""
+    if not db.session.execute(
+        db.update(User).where(User.username == username).values(is_moderator=not revoke)
+    ).rowcount:
+        raise click.BadParameter(f'no user named {username!r}')
+    db.session.commit()
+    click.echo(f'{username} is {"no longer" if revoke else "now"} a moderator.')
+
+
+@forum.cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False, allow_dash=True), default='-')
+@click.option('--batch-size', default=5000, show_default=True)
+def export_command(path, batch_size):
+    """Stream all forum data to PATH as NDJSON (gzipped if it ends in .gz)."""
+    start = time.perf_counter()
+    with _open_archive(path, 'w') as out:
+        counts = export_archive(out, batch_size=batch_size, log=lambda message: click.echo(message, err=True))
+    total = sum(counts.values())
+    elapsed = time.perf_counter() - start
+    click.echo(f'Exported {total} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} rows/s).', err=True)
+
+
+@forum.cli.command('import')
+@click.argument('path', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--batch-size', default=5000, show_default=True)
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None,
+              help='Progress file for resuming (default: PATH.checkpoint).')
+def import_command(path, batch_size, checkpoint):
+    """Load an NDJSON archive written by `flask forum export`."""
+    if checkpoint is None and path != '-':
+        checkpoint = path + '.checkpoint'
+    with _open_archive(path, 'r') as lines:
+        try:
+            import_archive(lines, batch_size=batch_size, checkpoint=checkpoint, log=click.echo)
+        except ValueError as exc:
+            raise click.ClickException(f'{exc}. Fix the archive and rerun to resume after the last committed batch.')
+    fragment_cache.clear()
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+
+def _open_archive(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return click.open_file(path, mode, encoding='utf-8')
+
+
+@forum.cli.command('bench')
+@click.option('--routes', default=','.join(ROUTES), show_default=True, help='Comma-separated routes.')
+@click.option('--requests', default=200, show_default=True, help='Requests per route.')
+@click.option('--concurrency', default=8, show_default=True)
+@click.option('--url', default=None, help='Benchmark a running server instead of the test client.')
+@click.option('--streams', default=0, show_default=True,
+              help='Live-update streams to hold open during the run (needs --url).')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Write results as JSON.')
+def bench_command(routes, requests, concurrency, url, streams, seed, output):
+    """Report p50/p95/p99 latency and throughput per route."""
+    app = current_app._get_current_object()
+    try:
+        results = run_benchmark(
+            app, routes=[r.strip() for r in routes.split(',') if r.strip()],
+            requests=requests, concurrency=concurrency, base_url=url, seed=seed, streams=streams,
+        )
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+
+    if streams:
+        click.echo(f"Held {results['streams_open']} of {streams} event streams open.")
+
+    click.echo(f"{'route':<16}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for route, stats in results['routes'].items():
+        click.echo(
+            f"{route:<16}{stats['throughput_rps']:>10}{stats['p50_ms']:>10}"
+            f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['errors']:>8}"
+        )
+    if output:
+        write_results(results, output)
+        click.echo(f'Results written to {output}')
+
+
+@forum.cli.command('bench-login')
+@click.option('--levels', default=','.join(map(str, LOGIN_LEVELS)), show_default=True,
+              help='Comma-separated numbers of concurrent logging-in clients.')
+@click.option('--readers', default=4, show_default=True, help='Concurrent clients browsing team boards.')
+@click.option('--duration', default=5.0, show_default=True, help='Seconds per level.')
+@click.option('--url', default=None, help='Benchmark a running server instead of the test client.')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Write results as JSON.')
+def bench_login_command(levels, readers, duration, url, seed, output):
+    """Report login throughput and page latency as concurrent logins grow."""
+    app = current_app._get_current_object()
+    try:
+        results = run_login_benchmark(
+            app, levels=[int(level) for level in levels.split(',') if level.strip()],
+            readers=readers, duration=duration, base_url=url, seed=seed,
+        )
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+
+    click.echo(f"{'logins':>7}{'login rps':>11}{'rejected':>10}{'read rps':>10}{'read p50':>10}{'read p95':>10}")
+    for level in results['levels']:
+        logins, reads = level['logins'] or {}, level['reads']
+        click.echo(
+            f"{level['login_concurrency']:>7}{logins.get('throughput_rps', '-'):>11}{logins.get('rejected', '-'):>10}"
+            f"{reads['throughput_rps']:>10}{reads['p50_ms']:>10}{reads['p95_ms']:>10}"
+        )
+    if output:
+        write_results(results, output)
+        click.echo(f'Results written to {output}')
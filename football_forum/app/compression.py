@@ -0,0 +1,100 @@
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/html', 'text/css', 'text/plain', 'text/javascript', 'application/json')
+
+
+class CompressionMiddleware:
+    # Compresses responses on the fly as the app produces them, so streamed
+    # pages stay streamed: output is flushed to the client whenever
+    # `flush_size` uncompressed bytes have gone through the compressor.
+
+    def __init__(self, wsgi_app, min_size=500, level=6, flush_size=16384):
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+        self.level = level
+        self.flush_size = flush_size
+
+    def __call__(self, environ, start_response):
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        encodings = [name for name in ('br', 'gzip') if accepted[name] and (name != 'br' or brotli)]
+        if not encodings or environ['REQUEST_METHOD'] == 'HEAD':
+            return self.wsgi_app(environ, start_response)
+
+        chosen = []
+
+        def compressing_start_response(status, headers, exc_info=None):
+            headers = Headers(headers)
+            if self._should_compress(status, headers):
+                chosen.append(encodings[0])
+                headers['Content-Encoding'] = encodings[0]
+                headers.remove('Content-Length')
+                vary = headers.get('Vary')
+                headers['Vary'] = f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding'
+                etag = headers.get('ETag')
+                if etag and not etag.startswith('W/'):
+                    headers['ETag'] = 'W/' + etag
+            return start_response(status, headers.to_wsgi_list(), exc_info)
+
+        app_iter = self.wsgi_app(environ, compressing_start_response)
+        if not chosen:
+            return app_iter
+        return self._compress(app_iter, chosen[0])
+
+    def _should_compress(self, status, headers):
+        if int(status.split(' ', 1)[0]) in (204, 206, 304) or 'Content-Encoding' in headers:
+            return False
+        if not headers.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+            return False
+        length = headers.get('Content-Length', type=int)
+        return length is None or length >= self.min_size
+
+    def _compress(self, app_iter, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=min(self.level, 11))
+            compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            compress = compressor.compress
+            flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)  # noqa: E731
+            finish = compressor.flush
+
+        # Start with a flush due, so the first chunk (the page's <head>)
+        # reaches the browser straight away.
+        pending = self.flush_size
+        try:
+            for chunk in app_iter:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                out = compress(chunk)
+                pending += len(chunk)
+                if pending >= self.flush_size:
+                    out += flush()
+                    pending = 0
+                if out:
+                    yield out
+            yield finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+def init_app(app):
+    app.config.setdefault('COMPRESSION_ENABLED', True)
+    app.config.setdefault('COMPRESSION_LEVEL', 6)
+    app.config.setdefault('COMPRESSION_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESSION_FLUSH_SIZE', 16384)
+    if app.config['COMPRESSION_ENABLED']:
+        app.wsgi_app = CompressionMiddleware(
+            app.wsgi_app,
+            min_size=app.config['COMPRESSION_MIN_SIZE'],
+            level=app.config['COMPRESSION_LEVEL'],
+            flush_size=app.config['COMPRESSION_FLUSH_SIZE'],
+        )
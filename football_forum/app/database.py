@@ -0,0 +1,77 @@
+from sqlalchemy import event
+
+from . import db
+from .ranking import register_sql_functions
+
+PRODUCTION_DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT': 5000,
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    'SQLITE_CACHE_SIZE': -64000,
+    'SQLITE_POOL_SIZE': 10,
+    'SQLITE_MAX_OVERFLOW': 20,
+    'SQLITE_POOL_TIMEOUT': 30,
+}
+
+
+def configure_engine_options(app):
+    # Must run before db.init_app(), which builds the engines from
+    # SQLALCHEMY_ENGINE_OPTIONS.
+    app.config.setdefault('SQLITE_PROFILE', 'default')
+    if app.config['SQLITE_PROFILE'] != 'production':
+        return
+
+    for key, value in PRODUCTION_DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options.setdefault('pool_size', app.config['SQLITE_POOL_SIZE'])
+    options.setdefault('max_overflow', app.config['SQLITE_MAX_OVERFLOW'])
+    options.setdefault('pool_timeout', app.config['SQLITE_POOL_TIMEOUT'])
+    connect_args = options.setdefault('connect_args', {})
+    connect_args.setdefault('timeout', app.config['SQLITE_BUSY_TIMEOUT'] / 1000)
+    connect_args.setdefault('check_same_thread', False)
+
+
+def init_app(app):
+    # On by default so ON DELETE CASCADE removes a post's comments, votes and
+    # timeline entries inside SQLite; see app/moderation.py.
+    app.config.setdefault('SQLITE_FOREIGN_KEYS', True)
+
+    listeners = [register_sql_functions]
+    if app.config['SQLITE_FOREIGN_KEYS']:
+        listeners.append(_enable_foreign_keys)
+    if app.config['SQLITE_PROFILE'] == 'production':
+        listeners.append(_pragma_listener(app.config))
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                for listener in listeners:
+                    event.listen(engine, 'connect', listener)
+
+
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+def _pragma_listener(config):
+    pragmas = [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return apply_pragmas
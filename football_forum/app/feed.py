@@ -0,0 +1,179 @@
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db
+from .models import Team, Post, TeamFollow, TimelineEntry
+from .pagination import keyset_filter, keyset_split
+
+# Keeps the newest FEED_TIMELINE_SIZE entries of one user's timeline.
+_TRIM_TIMELINE = db.text(
+    'DELETE FROM timeline_entries WHERE user_id = :user_id AND (timestamp, post_id) <= ('
+    '  SELECT timestamp, post_id FROM timeline_entries WHERE user_id = :user_id'
+    '  ORDER BY timestamp DESC, post_id DESC LIMIT 1 OFFSET :size)'
+)
+
+
+def follow(user_id, team_id):
+    # Returns True if the user was not following the team yet. Recent posts
+    # are copied into the timeline straight away, so the feed is not empty
+    # until the team's next post.
+    result = db.session.execute(
+        sqlite_insert(TeamFollow)
+        .values(user_id=user_id, team_id=team_id)
+        .on_conflict_do_nothing(index_elements=['user_id', 'team_id'])
+    )
+    if result.rowcount != 1:
+        return False
+    db.session.execute(
+        db.update(Team).where(Team.id == team_id).values(follower_count=Team.follower_count + 1)
+    )
+    size = current_app.config['FEED_TIMELINE_SIZE']
+    recent = (
+        db.select(db.literal(user_id), Post.id, Post.team_id, Post.timestamp)
+        .where(Post.team_id == team_id)
+        .order_by(Post.timestamp.desc(), Post.id.desc())
+        .limit(size)
+    )
+    db.session.execute(
+        db.insert(TimelineEntry).prefix_with('OR IGNORE')
+        .from_select(['user_id', 'post_id', 'team_id', 'timestamp'], recent)
+    )
+    trim_timelines([user_id])
+    return True
+
+
+def unfollow(user_id, team_id):
+    result = db.session.execute(
+        db.delete(TeamFollow).where(TeamFollow.user_id == user_id, TeamFollow.team_id == team_id)
+    )
+    if result.rowcount != 1:
+        return False
+    db.session.execute(
+        db.update(Team).where(Team.id == team_id).values(follower_count=Team.follower_count - 1)
+    )
+    db.session.execute(
+        db.delete(TimelineEntry).where(TimelineEntry.user_id == user_id, TimelineEntry.team_id == team_id)
+    )
+    return True
+
+
+def is_following(user_id, team_id):
+    return db.session.get(TeamFollow, (user_id, team_id)) is not None
+
+
+def fan_out(post_ids):
+    # Writes each post into the timeline of every follower of its team with
+    # one INSERT ... SELECT per post. Teams with more than FEED_FANOUT_LIMIT
+    # followers are skipped; their posts are merged in when the feed is read.
+    limit = current_app.config['FEED_FANOUT_LIMIT']
+    posts = db.session.execute(
+        db.select(Post.id, Post.team_id, Post.timestamp)
+        .join(Team, Team.id == Post.team_id)
+        .where(Post.id.in_(post_ids), Team.follower_count <= limit)
+    ).all()
+    for post in posts:
+        followers = db.select(
+            TeamFollow.user_id, db.literal(post.id), db.literal(post.team_id), db.literal(post.timestamp)
+        ).where(TeamFollow.team_id == post.team_id)
+        db.session.execute(
+            db.insert(TimelineEntry).prefix_with('OR IGNORE')
+            .from_select(['user_id', 'post_id', 'team_id', 'timestamp'], followers)
+        )
+
+    # A trim steps FEED_TIMELINE_SIZE index entries per follower, so each
+    # team's followers are only trimmed once FEED_TRIM_EVERY of its posts
+    # have been fanned out. Timelines may overshoot the size by roughly that
+    # many entries per followed team; reads only ever look at the newest page.
+    fanned = Counter(post.team_id for post in posts)
+    if not fanned:
+        return 0
+    teams = Team.__table__
+    db.session.execute(
+        teams.update().where(teams.c.id == db.bindparam('team'))
+        .values(untrimmed_posts=teams.c.untrimmed_posts + db.bindparam('posts')),
+        [{'team': team_id, 'posts': count} for team_id, count in fanned.items()],
+    )
+    every = current_app.config['FEED_TRIM_EVERY']
+    due = db.session.scalars(
+        db.select(Team.id).where(Team.id.in_(fanned), Team.untrimmed_posts >= every)
+    ).all()
+    if due:
+        db.session.execute(db.update(Team).where(Team.id.in_(due)).values(untrimmed_posts=0))
+        trim_timelines(db.session.scalars(
+            db.select(TeamFollow.user_id).where(TeamFollow.team_id.in_(due)).distinct()
+        ).all())
+    return len(posts)
+
+
+def trim_timelines(user_ids):
+    if user_ids:
+        size = current_app.config['FEED_TIMELINE_SIZE']
+        db.session.execute(_TRIM_TIMELINE, [{'user_id': user_id, 'size': size} for user_id in user_ids])
+
+
+def rebuild_feeds():
+    # Recounts followers and refills every timeline from the follows, the
+    # way follow() backfills one; used after a bulk import.
+    follower_counts = (
+        db.select(db.func.count()).where(TeamFollow.team_id == Team.id).scalar_subquery()
+    )
+    db.session.execute(db.update(Team).values(follower_count=follower_counts, untrimmed_posts=0))
+    db.session.execute(db.delete(TimelineEntry))
+    size = current_app.config['FEED_TIMELINE_SIZE']
+    recent = (
+        db.select(Post.id)
+        .where(Post.team_id == TeamFollow.team_id)
+        .order_by(Post.timestamp.desc(), Post.id.desc())
+        .limit(size)
+        .correlate(TeamFollow)
+    )
+    db.session.execute(
+        db.insert(TimelineEntry).from_select(
+            ['user_id', 'post_id', 'team_id', 'timestamp'],
+            db.select(TeamFollow.user_id, Post.id, Post.team_id, Post.timestamp)
+            .join(Post, Post.id.in_(recent)),
+        )
+    )
+    trim_timelines(db.session.scalars(db.select(TeamFollow.user_id).distinct()).all())
+
+
+def read_feed(user_id, before=None, per_page=20):
+    # Newest-first page of posts from the teams `user_id` follows: a range
+    # scan of the user's timeline, plus one per-team range scan for each
+    # followed team too big to fan out to.
+    limit = current_app.config['FEED_FANOUT_LIMIT']
+    big_teams = db.session.scalars(
+        db.select(TeamFollow.team_id)
+        .join(Team, Team.id == TeamFollow.team_id)
+        .where(TeamFollow.user_id == user_id, Team.follower_count > limit)
+    ).all()
+
+    rows = db.session.execute(keyset_filter(
+        db.select(TimelineEntry.post_id, TimelineEntry.timestamp).where(TimelineEntry.user_id == user_id),
+        TimelineEntry.timestamp, TimelineEntry.post_id, before, per_page,
+    )).all()
+    if big_teams:
+        pulled = [
+            keyset_filter(
+                db.select(Post.id.label('post_id'), Post.timestamp).where(Post.team_id == team_id),
+                Post.timestamp, Post.id, before, per_page,
+            ).subquery()
+            for team_id in big_teams
+        ]
+        rows += db.session.execute(db.union_all(*(db.select(*page.c) for page in pulled))).all()
+        # A team that outgrew the limit can have posts in both.
+        rows = list({row.post_id: row for row in rows}.values())
+        rows.sort(key=lambda row: (row.timestamp, row.post_id), reverse=True)
+        rows = rows[:per_page + 1]
+
+    rows, next_cursor = keyset_split(rows, TimelineEntry.timestamp, TimelineEntry.post_id, per_page)
+    if not rows:
+        return [], next_cursor
+    posts = {
+        post.id: post
+        for post in Post.query.options(db.joinedload(Post.author), db.joinedload(Post.team))
+        .filter(Post.id.in_([row.post_id for row in rows]))
+    }
+    return [posts[row.post_id] for row in rows if row.post_id in posts], next_cursor
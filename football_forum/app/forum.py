@@ -1,23 +1,106 @@
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import (
+    Blueprint, Response, render_template, request, redirect, url_for, flash, current_app, jsonify, abort,
+    get_flashed_messages, stream_template, stream_with_context,
+)
 from flask_login import login_required, current_user
-from .models import db, Team, Post, Comment, PostVote, CommentVote
+from sqlalchemy.orm.attributes import set_committed_value
+from . import login_manager
+from . import feed
+from . import moderation
+from .fragment_cache import fragment_cache
+from .instrumentation import query_budget
+from .jobs import job_queue
+from .latest import LatestPost, latest_posts
+from .live import HubFull, live_updates
+from .models import db, Team, TeamStats, Post, Comment, PostVote, CommentVote
+from .moderation import moderator_required
+from .pagination import keyset_page
+from .replicas import replica_reads
+from . import search as search_index
 
 forum = Blueprint('forum', __name__, url_prefix='/teams')
 
+
+def wants_json():
+    # script.js asks for JSON; plain form posts keep the redirect flow.
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+
 @forum.route('/')
+@replica_reads
+@query_budget(2)
 def list_teams():
     
-    teams = Team.query.all()
-    return render_template('teams.html', teams=teams)
+    fragment = fragment_cache.cached(
+        'teams', ['teams'],
+        lambda: render_template('fragments/teams.html', teams=db.session.execute(
+            db.select(Team, TeamStats).outerjoin(TeamStats, TeamStats.team_id == Team.id).order_by(Team.name)
+        ).all()),
+    )
+    return render_template('teams.html', fragment=fragment)
+
+
+@forum.route('/search')
+@query_budget(3)
+def search():
+    terms = request.args.get('q', '').strip()
+    team_id = request.args.get('team_id', type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    results, has_next = search_index.search(
+        terms, team_id=team_id, page=page, per_page=current_app.config['POSTS_PER_PAGE']
+    )
+    teams = Team.query.order_by(Team.name).all()
+    return render_template(
+        'search.html', terms=terms, team_id=team_id, teams=teams,
+        results=results, page=page, has_next=has_next,
+    )
 
 
 @forum.route('/<int:team_id>')
+@replica_reads
+@query_budget(4)
 def team_posts(team_id):
     
-    team = Team.query.get_or_404(team_id)
-    posts = Post.query.filter_by(team_id=team_id).order_by(Post.timestamp.desc()).all()
-    return render_template('team_posts.html', team=team, posts=posts)
+    sort = 'hot' if request.args.get('sort') == 'hot' else 'new'
+    before = request.args.get('before')
+
+    def render():
+        team = Team.query.get_or_404(team_id)
+        posts, next_cursor = keyset_page(
+            Post.query.options(db.joinedload(Post.author)).filter_by(team_id=team_id),
+            Post.hot_score if sort == 'hot' else Post.timestamp,
+            Post.id,
+            before=before,
+            per_page=current_app.config['POSTS_PER_PAGE'],
+        )
+        return render_template(
+            'fragments/team_posts.html', team=team, posts=posts, sort=sort, next_cursor=next_cursor
+        )
+
+    fragment = fragment_cache.cached(
+        f'team_posts:{team_id}:{sort}:{before or ""}', [f'team:{team_id}:{sort}'], render
+    )
+    # The fragment is shared by everyone; whether this user follows the
+    # team is rendered around it.
+    following = current_user.is_authenticated and feed.is_following(current_user.id, team_id)
+    return render_template('team_posts.html', fragment=fragment, team_id=team_id, following=following)
+
+
+@forum.route('/<int:team_id>/follow', methods=['POST'])
+@login_required
+def follow_team(team_id):
+    Team.query.get_or_404(team_id)
+    if request.form.get('action') == 'unfollow':
+        feed.unfollow(current_user.id, team_id)
+        message = 'Unfollowed.'
+    else:
+        feed.follow(current_user.id, team_id)
+        message = 'Following! New posts will show up on your dashboard.'
+    db.session.commit()
+    flash(message, 'success')
+    return redirect(url_for('forum.team_posts', team_id=team_id))
 
 
 @forum.route('/<int:team_id>/post/new', methods=['GET', 'POST'])
@@ -41,20 +124,54 @@ def new_post(team_id):
             team_id=team.id
         )
         db.session.add(post)
+        db.session.flush()
+        TeamStats.record(team.id, post.timestamp, posts=1)
+        job_queue.enqueue('index_posts', post_id=post.id)
+        job_queue.enqueue('fan_out', post_id=post.id)
+        latest = LatestPost(post.id, team.id, team.name, title, current_user.username, post.timestamp)
         db.session.commit()
+        fragment_cache.invalidate(f'team:{team_id}:new', f'team:{team_id}:hot', 'teams')
+        latest_posts.push(latest)
 
         flash('Post created successfully!', 'success')
-        return redirect(url_for('forum.team_posts', team_id=team.id))
+        return redirect(url_for('forum.team_posts', team_id=team_id))
 
 
     return render_template('new_post.html', team=team)
 
 
+def stream_page(template, **context):
+    # Flashes are popped from the session now, before the headers (and the
+    # session cookie) are sent; the template reads them back from the request.
+    get_flashed_messages(with_categories=True)
+    chunk_size = current_app.config['STREAM_CHUNK_SIZE']
+
+    def generate():
+        # Jinja yields every text node separately; coalesce them so each
+        # write to the socket (and each compressor flush) carries a useful
+        # amount of HTML.
+        buffer = []
+        size = 0
+        for piece in stream_template(template, **context):
+            buffer.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield ''.join(buffer)
+
+    return Response(stream_with_context(generate()), mimetype='text/html')
+
+
 @forum.route('/<int:team_id>/post/<int:post_id>', methods=['GET', 'POST'])
+@replica_reads
+@query_budget(7)
 def post_detail(team_id, post_id):
     
     team = Team.query.get_or_404(team_id)
-    post = Post.query.get_or_404(post_id)
+    post = Post.query.options(db.joinedload(Post.author)).filter_by(id=post_id).first_or_404()
 
 
     if post.team_id != team.id:
@@ -63,11 +180,21 @@ def post_detail(team_id, post_id):
 
     if request.method == 'POST':
         if not current_user.is_authenticated:
+            if wants_json():
+                return jsonify(error='You must be logged in to comment.'), 401
             flash('You must be logged in to comment.', 'error')
             return redirect(url_for('auth.login'))
 
+        if post.locked:
+            if wants_json():
+                return jsonify(error='This thread is locked.'), 403
+            flash('This thread is locked.', 'error')
+            return redirect(url_for('forum.post_detail', team_id=team.id, post_id=post.id))
+
         comment_content = request.form.get('comment_content')
         if not comment_content:
+            if wants_json():
+                return jsonify(error='Comment cannot be empty.'), 400
             flash('Comment cannot be empty.', 'error')
             return redirect(url_for('forum.post_detail', team_id=team.id, post_id=post.id))
 
@@ -77,14 +204,86 @@ def post_detail(team_id, post_id):
             post_id=post.id
         )
         db.session.add(new_comment)
+        db.session.flush()
+        Post.bump_comment_count(post.id)
+        TeamStats.record(team.id, new_comment.timestamp, comments=1)
+        job_queue.enqueue('index_comments', comment_id=new_comment.id)
+        # Rendered before the commit expires the new row; the author is the
+        # signed-in user, so skip loading it again.
+        set_committed_value(new_comment, 'author', current_user._get_current_object())
+        html = render_template('fragments/comment.html', comment=new_comment, team=team, post=post)
+        event = {'id': new_comment.id, 'html': html}
+        if live_updates.has_subscribers(f'post:{post_id}'):
+            event['anonymous_html'] = render_template(
+                'fragments/comment.html', comment=new_comment, team=team, post=post,
+                current_user=login_manager.anonymous_user(),
+            )
         db.session.commit()
+        fragment_cache.invalidate(f'team:{team_id}:hot', 'teams')
+        live_updates.publish(f'post:{post_id}', 'comment', event)
 
+        if wants_json():
+            return jsonify(id=event['id'], html=html), 201
         flash('Comment added!', 'success')
-        return redirect(url_for('forum.post_detail', team_id=team.id, post_id=post.id))
+        return redirect(url_for('forum.post_detail', team_id=team_id, post_id=post_id))
 
 
-    comments = Comment.query.filter_by(post_id=post.id).order_by(Comment.timestamp.asc()).all()
-    return render_template('post_detail.html', team=team, post=post, comments=comments)
+    comments = (
+        db.select(Comment).options(db.joinedload(Comment.author))
+        .filter_by(post_id=post.id)
+        .order_by(Comment.timestamp.asc())
+    )
+    events_url = url_for('forum.post_events', team_id=team_id, post_id=post_id) if live_updates.enabled else None
+    threshold = current_app.config['STREAM_COMMENTS_THRESHOLD']
+    if threshold and post.comment_count >= threshold:
+        # Big threads go out while the comments are still being read, a
+        # batch at a time, instead of being built up in memory first.
+        comments = db.session.scalars(comments.execution_options(yield_per=current_app.config['STREAM_BATCH_SIZE']))
+        return stream_page('post_detail.html', team=team, post=post, comments=comments, events_url=events_url)
+    return render_template('post_detail.html', team=team, post=post, comments=db.session.scalars(comments).all(), events_url=events_url)
+
+
+@forum.route('/<int:team_id>/post/<int:post_id>/events')
+def post_events(team_id, post_id):
+    if not live_updates.enabled:
+        abort(404)
+    if db.session.query(Post.team_id).filter_by(id=post_id).scalar() != team_id:
+        abort(404)
+
+    try:
+        stream = live_updates.stream(f'post:{post_id}')
+    except HubFull:
+        return 'Too many live connections.', 503, {'Retry-After': '30'}
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@forum.route('/<int:team_id>/post/<int:post_id>/delete', methods=['POST'])
+@login_required
+@moderator_required
+def delete_post(team_id, post_id):
+    if db.session.query(Post.team_id).filter_by(id=post_id).scalar() != team_id:
+        abort(404)
+    team_ids = moderation.delete_posts([post_id])
+    db.session.commit()
+    moderation.forget(team_ids, [post_id])
+    flash('Post deleted.', 'success')
+    return redirect(url_for('forum.team_posts', team_id=team_id))
+
+
+@forum.route('/<int:team_id>/post/<int:post_id>/lock', methods=['POST'])
+@login_required
+@moderator_required
+def lock_post(team_id, post_id):
+    if db.session.query(Post.team_id).filter_by(id=post_id).scalar() != team_id:
+        abort(404)
+    locked = request.form.get('action') != 'unlock'
+    moderation.set_locked(post_id, locked)
+    db.session.commit()
+    flash('Thread locked.' if locked else 'Thread unlocked.', 'success')
+    return redirect(url_for('forum.post_detail', team_id=team_id, post_id=post_id))
 
 
 @forum.route('/<int:team_id>/post/<int:post_id>/upvote', methods=['POST'])
@@ -93,18 +292,26 @@ def upvote_post(team_id, post_id):
     
     post = Post.query.get_or_404(post_id)
     if post.team_id != team_id:
+        if wants_json():
+            return jsonify(error='This post does not belong to that team.'), 404
         flash('This post does not belong to that team.', 'error')
         return redirect(url_for('forum.team_posts', team_id=team_id))
 
-    existing_vote = PostVote.query.filter_by(user_id=current_user.id, post_id=post.id).first()
-    if existing_vote:
+    created = PostVote.cast(current_user.id, post.id)
+    db.session.commit()
+    score = None
+    if created or wants_json():
+        score = db.session.query(Post.vote_score).filter_by(id=post_id).scalar()
+    if created:
+        fragment_cache.invalidate(f'team:{team_id}:hot')
+        live_updates.publish(f'post:{post_id}', 'post_score', {'vote_score': score})
+
+    if wants_json():
+        return jsonify(created=created, vote_score=score)
+    if not created:
         flash('You already upvoted this post.', 'info')
         return redirect(url_for('forum.post_detail', team_id=team_id, post_id=post_id))
 
-    vote = PostVote(value=1, user_id=current_user.id, post_id=post.id)
-    db.session.add(vote)
-    db.session.commit()
-
     flash('Post upvoted!', 'success')
     return redirect(url_for('forum.post_detail', team_id=team_id, post_id=post_id))
 
@@ -115,18 +322,25 @@ def upvote_comment(team_id, post_id, comment_id):
   
     comment = Comment.query.get_or_404(comment_id)
     if comment.post_id != post_id:
+        if wants_json():
+            return jsonify(error='This comment does not belong to that post.'), 404
         flash('This comment does not belong to that post.', 'error')
         return redirect(url_for('forum.post_detail', team_id=team_id, post_id=post_id))
 
-    existing_vote = CommentVote.query.filter_by(user_id=current_user.id, comment_id=comment.id).first()
-    if existing_vote:
+    created = CommentVote.cast(current_user.id, comment.id)
+    db.session.commit()
+    score = None
+    if created or wants_json():
+        score = db.session.query(Comment.vote_score).filter_by(id=comment_id).scalar()
+    if created:
+        live_updates.publish(f'post:{post_id}', 'comment_score', {'id': comment_id, 'vote_score': score})
+
+    if wants_json():
+        return jsonify(created=created, vote_score=score)
+    if not created:
         flash('You already upvoted this comment.', 'info')
         return redirect(url_for('forum.post_detail', team_id=team_id, post_id=post_id))
 
-    vote = CommentVote(value=1, user_id=current_user.id, comment_id=comment.id)
-    db.session.add(vote)
-    db.session.commit()
-
     flash('Comment upvoted!', 'success')
     return redirect(url_for('forum.post_detail', team_id=team_id, post_id=post_id))
 
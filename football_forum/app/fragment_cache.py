@@ -0,0 +1,211 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+from .instrumentation import metrics
+from .replicas import reading_from_replica, replica_router
+
+
+class MemoryBackend:
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.tags = {}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _ = entry
+            if expires_at < time.time():
+                self._discard(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, tags, ttl):
+        with self.lock:
+            self._discard(key)
+            self.entries[key] = (time.time() + ttl, value, tuple(tags))
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.maxsize:
+                self._discard(next(iter(self.entries)))
+
+    def invalidate(self, tags):
+        with self.lock:
+            for tag in tags:
+                for key in list(self.tags.get(tag, ())):
+                    self._discard(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+
+class SQLiteBackend:
+    # Shared store for multi-process deployments: every worker reads and
+    # invalidates the same file, so a write in one worker is seen by all.
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(
+                'CREATE TABLE IF NOT EXISTS fragments ('
+                '  key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL);'
+                'CREATE TABLE IF NOT EXISTS fragment_tags ('
+                '  tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key));'
+                'CREATE INDEX IF NOT EXISTS ix_fragment_tags_key ON fragment_tags (key);'
+                'CREATE INDEX IF NOT EXISTS ix_fragments_expires_at ON fragments (expires_at);'
+            )
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self.local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value FROM fragments WHERE key = ? AND expires_at >= ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, tags, ttl):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # Keys include pagination cursors, so expired rows are pruned
+            # here rather than left for a lookup that may never come.
+            conn.execute(
+                'DELETE FROM fragment_tags WHERE key IN (SELECT key FROM fragments WHERE expires_at < ?)', (now,)
+            )
+            conn.execute('DELETE FROM fragments WHERE expires_at < ?', (now,))
+            conn.execute(
+                'INSERT OR REPLACE INTO fragments (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, now + ttl),
+            )
+            conn.execute('DELETE FROM fragment_tags WHERE key = ?', (key,))
+            conn.executemany(
+                'INSERT OR IGNORE INTO fragment_tags (tag, key) VALUES (?, ?)',
+                [(tag, key) for tag in tags],
+            )
+
+    def invalidate(self, tags):
+        conn = self._connect()
+        placeholders = ','.join('?' * len(tags))
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                f'DELETE FROM fragments WHERE key IN '
+                f'(SELECT key FROM fragment_tags WHERE tag IN ({placeholders}))',
+                tags,
+            )
+            conn.execute(
+                f'DELETE FROM fragment_tags WHERE key IN '
+                f'(SELECT key FROM fragment_tags WHERE tag IN ({placeholders}))',
+                tags,
+            )
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM fragments')
+            conn.execute('DELETE FROM fragment_tags')
+
+
+class NullBackend:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, tags, ttl):
+        pass
+
+    def invalidate(self, tags):
+        pass
+
+    def clear(self):
+        pass
+
+
+class FragmentCache:
+    def __init__(self):
+        self.backend = NullBackend()
+        self.ttl = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE_BACKEND', 'memory')
+        app.config.setdefault('FRAGMENT_CACHE_SIZE', 512)
+        app.config.setdefault('FRAGMENT_CACHE_TTL', 300)
+        app.config.setdefault('FRAGMENT_CACHE_PATH', os.path.join(app.instance_path, 'fragments.db'))
+
+        backend = app.config['FRAGMENT_CACHE_BACKEND']
+        if backend == 'memory':
+            backend = MemoryBackend(app.config['FRAGMENT_CACHE_SIZE'])
+        elif backend == 'sqlite':
+            os.makedirs(os.path.dirname(app.config['FRAGMENT_CACHE_PATH']), exist_ok=True)
+            backend = SQLiteBackend(app.config['FRAGMENT_CACHE_PATH'])
+        elif backend in (None, 'null'):
+            backend = NullBackend()
+        self.backend = backend
+        self.ttl = app.config['FRAGMENT_CACHE_TTL']
+
+    def cached(self, key, tags, render):
+        # Returns the stored HTML for `key`, calling `render()` and storing its
+        # result under `tags` on a miss.
+        value = self.backend.get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            value = render()
+            # A fragment rendered from a replica may predate the write that
+            # last invalidated it, so keep it no longer than replicas may lag.
+            ttl = min(self.ttl, replica_router.max_lag) if reading_from_replica() else self.ttl
+            self.backend.set(key, value, tags, ttl)
+        return Markup(value)
+
+    def invalidate(self, *tags):
+        self.backend.invalidate(tags)
+
+    def clear(self):
+        self.backend.clear()
+
+    def collect(self):
+        with self.lock:
+            return [
+                ('forum_fragment_cache_hits_total', 'counter', 'Rendered fragment cache hits.', [({}, self.hits)]),
+                ('forum_fragment_cache_misses_total', 'counter', 'Rendered fragment cache misses.', [({}, self.misses)]),
+            ]
+
+
+fragment_cache = FragmentCache()
+metrics.add_collector(fragment_cache.collect)
@@ -0,0 +1,200 @@
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.request_latency = defaultdict(Histogram)
+        self.function_latency = defaultdict(Histogram)
+        self.sql_statements = defaultdict(int)
+        self.sql_seconds = defaultdict(float)
+        self.collectors = []
+
+    def observe_request(self, endpoint, seconds, statements, sql_seconds):
+        with self.lock:
+            self.request_latency[endpoint].observe(seconds)
+            self.sql_statements[endpoint] += statements
+            self.sql_seconds[endpoint] += sql_seconds
+
+    def observe_function(self, name, seconds):
+        with self.lock:
+            self.function_latency[name].observe(seconds)
+
+    def add_collector(self, collector):
+        # `collector` returns (name, type, help, [(labels, value), ...]) tuples
+        # and is called on every scrape.
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            _render_histograms(
+                lines, 'forum_request_duration_seconds', 'Request latency by endpoint.',
+                'endpoint', self.request_latency,
+            )
+            _render_histograms(
+                lines, 'forum_function_duration_seconds', 'Latency of instrumented hot-path functions.',
+                'function', self.function_latency,
+            )
+            _render_samples(
+                lines, 'forum_sql_statements_total', 'counter', 'SQL statements executed by endpoint.',
+                [({'endpoint': k}, v) for k, v in sorted(self.sql_statements.items())],
+            )
+            _render_samples(
+                lines, 'forum_sql_duration_seconds_total', 'counter', 'Time spent in SQL by endpoint.',
+                [({'endpoint': k}, v) for k, v in sorted(self.sql_seconds.items())],
+            )
+        for collector in self.collectors:
+            for name, kind, help, samples in collector():
+                _render_samples(lines, name, kind, help, samples)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def init_app(app):
+    app.config.setdefault('QUERY_BUDGET_ENFORCE', app.testing)
+
+    enabled = app.config['METRICS_ENABLED']
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _count_query)
+            if enabled:
+                event.listen(engine, 'before_cursor_execute', _start_query_timer)
+                event.listen(engine, 'after_cursor_execute', _stop_query_timer)
+
+    if enabled:
+        app.before_request(_start_request_timer)
+        app.teardown_request(_record_request)
+        app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if not has_app_context():
+        return
+    g.sql_time = g.get('sql_time', 0.0) + elapsed
+    if elapsed >= current_app.config['SLOW_QUERY_THRESHOLD']:
+        logger.warning('Slow query (%.3fs): %s', elapsed, statement)
+
+
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+def _record_request(exc):
+    if 'request_start' not in g:
+        return
+    metrics.observe_request(
+        request.endpoint or 'none',
+        time.perf_counter() - g.request_start,
+        g.get('query_count', 0),
+        g.get('sql_time', 0.0),
+    )
+
+
+def metrics_view():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if current_app.config['METRICS_ENABLED']:
+                    metrics.observe_function(name, time.perf_counter() - start)
+        return wrapped
+    return decorator
+
+
+def query_budget(limit):
+    # Fails (or warns) when a view issues more than `limit` statements, so a
+    # lazy load that slips back into a loop shows up as soon as a page has rows.
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            start = g.get('query_count', 0)
+            response = view(*args, **kwargs)
+            used = g.get('query_count', 0) - start
+            if used > limit:
+                message = f'{request.endpoint} issued {used} queries (budget {limit})'
+                if current_app.config['QUERY_BUDGET_ENFORCE']:
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+        return wrapped
+    return decorator
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _render_samples(lines, name, kind, help, samples):
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} {kind}')
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+
+def _render_histograms(lines, name, help, label, histograms):
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} histogram')
+    for key, histogram in sorted(histograms.items()):
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{name}_bucket{_format_labels({label: key, "le": bound})} {count}')
+        lines.append(f'{name}_bucket{_format_labels({label: key, "le": "+Inf"})} {histogram.count}')
+        lines.append(f'{name}_sum{_format_labels({label: key})} {histogram.sum}')
+        lines.append(f'{name}_count{_format_labels({label: key})} {histogram.count}')
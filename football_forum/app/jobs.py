@@ -0,0 +1,196 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from . import db
+from .feed import fan_out
+from .instrumentation import metrics
+from .models import Job
+from . import search as search_index
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def handler(kind):
+    # Registers `func(payloads)` for jobs of `kind`. It gets a whole batch of
+    # payloads at once and runs in the same transaction that deletes them.
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+class JobQueue:
+    # Durable queue in the `jobs` table. Jobs are claimed in batches of one
+    # kind by setting a lease; a batch that raises is retried job by job so
+    # one bad payload cannot hold back the rest, with exponential backoff,
+    # until `max_attempts` is reached and the job is parked as failed.
+
+    def __init__(self):
+        self.inline = False
+        self.max_attempts = 5
+        self.retry_delay = 5
+        self.lease = 60
+        self.lock = threading.Lock()
+        self.done = defaultdict(int)
+        self.retried = defaultdict(int)
+        self.failed = defaultdict(int)
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_INLINE', False)
+        app.config.setdefault('JOBS_MAX_ATTEMPTS', 5)
+        app.config.setdefault('JOBS_RETRY_DELAY', 5)
+        app.config.setdefault('JOBS_LEASE', 60)
+
+        self.inline = app.config['JOBS_INLINE']
+        self.max_attempts = app.config['JOBS_MAX_ATTEMPTS']
+        self.retry_delay = app.config['JOBS_RETRY_DELAY']
+        self.lease = app.config['JOBS_LEASE']
+
+    def enqueue(self, kind, **payload):
+        # Joins the caller's transaction: the job exists only if the write
+        # that queued it commits. With JOBS_INLINE the work is done right here.
+        if kind not in HANDLERS:
+            raise KeyError(f'no job handler for {kind!r}')
+        if self.inline:
+            HANDLERS[kind]([payload])
+            return
+        db.session.add(Job(kind=kind, payload=json.dumps(payload)))
+
+    def claim(self, batch_size):
+        # One statement, so concurrent workers never claim the same job.
+        now = datetime.utcnow()
+        jobs = Job.__table__
+        ready = db.and_(
+            jobs.c.failed_at.is_(None),
+            jobs.c.run_at <= now,
+            db.or_(jobs.c.locked_until.is_(None), jobs.c.locked_until < now),
+        )
+        oldest_kind = db.select(jobs.c.kind).where(ready).order_by(jobs.c.id).limit(1).scalar_subquery()
+        ids = db.select(jobs.c.id).where(ready, jobs.c.kind == oldest_kind).order_by(jobs.c.id).limit(batch_size)
+        rows = db.session.execute(
+            db.update(jobs)
+            .where(jobs.c.id.in_(ids))
+            .values(locked_until=now + timedelta(seconds=self.lease), attempts=jobs.c.attempts + 1)
+            .returning(jobs.c.id, jobs.c.kind, jobs.c.payload, jobs.c.attempts)
+        ).all()
+        db.session.commit()
+        return sorted(rows, key=lambda row: row.id)
+
+    def run(self, rows):
+        kind = rows[0].kind
+        try:
+            HANDLERS[kind]([json.loads(row.payload) for row in rows])
+            db.session.execute(db.delete(Job).where(Job.id.in_([row.id for row in rows])))
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+            if len(rows) == 1:
+                self._retry(rows[0], exc)
+                return
+        else:
+            with self.lock:
+                self.done[kind] += len(rows)
+            return
+        for row in rows:
+            self.run([row])
+
+    def _retry(self, row, exc):
+        logger.exception('Job %s (%s) failed on attempt %s', row.id, row.kind, row.attempts)
+        now = datetime.utcnow()
+        values = {'locked_until': None, 'last_error': repr(exc)[:2000]}
+        if row.attempts >= self.max_attempts:
+            values['failed_at'] = now
+        else:
+            values['run_at'] = now + timedelta(seconds=self.retry_delay * 2 ** (row.attempts - 1))
+        db.session.execute(db.update(Job).where(Job.id == row.id).values(**values))
+        db.session.commit()
+        with self.lock:
+            if 'failed_at' in values:
+                self.failed[row.kind] += 1
+            else:
+                self.retried[row.kind] += 1
+
+    def work(self, app, stop, batch_size=100, poll_interval=1.0, burst=False, log=None):
+        # Worker loop for one thread. With `burst`, returns once nothing is
+        # ready instead of polling.
+        while not stop.is_set():
+            with app.app_context():
+                try:
+                    rows = self.claim(batch_size)
+                except OperationalError:
+                    # Typically a long write lock held elsewhere; try again
+                    # after the poll interval. Claimed jobs are safe: their
+                    # lease simply runs out.
+                    logger.exception('Could not claim jobs')
+                    db.session.rollback()
+                    rows = []
+                if rows:
+                    start = time.perf_counter()
+                    self.run(rows)
+                    if log:
+                        log(f'{rows[0].kind}: {len(rows)} jobs in {time.perf_counter() - start:.3f}s')
+                    continue
+            if burst:
+                return
+            stop.wait(poll_interval)
+
+    def depth(self):
+        now = datetime.utcnow()
+        state = db.case(
+            (Job.failed_at.is_not(None), 'failed'),
+            (Job.run_at > now, 'scheduled'),
+            (Job.locked_until >= now, 'running'),
+            else_='ready',
+        )
+        rows = db.session.execute(
+            db.select(Job.kind, state, db.func.count(), db.func.min(Job.created_at)).group_by(Job.kind, state)
+        ).all()
+        return [(kind, state, count, (now - oldest).total_seconds()) for kind, state, count, oldest in rows]
+
+    def collect(self):
+        try:
+            depth = self.depth()
+        except OperationalError:
+            db.session.rollback()
+            depth = []
+        with self.lock:
+            done, retried, failed = dict(self.done), dict(self.retried), dict(self.failed)
+        return [
+            ('forum_jobs_queued', 'gauge', 'Jobs in the queue by kind and state.',
+             [({'kind': kind, 'state': state}, count) for kind, state, count, _ in depth]),
+            ('forum_jobs_oldest_ready_seconds', 'gauge', 'Age of the oldest job waiting to run.',
+             [({'kind': kind}, age) for kind, state, _, age in depth if state == 'ready']),
+            ('forum_jobs_done_total', 'counter', 'Jobs completed by this process.',
+             [({'kind': kind}, count) for kind, count in sorted(done.items())]),
+            ('forum_jobs_retried_total', 'counter', 'Job attempts that failed and were rescheduled.',
+             [({'kind': kind}, count) for kind, count in sorted(retried.items())]),
+            ('forum_jobs_failed_total', 'counter', 'Jobs that used up their attempts.',
+             [({'kind': kind}, count) for kind, count in sorted(failed.items())]),
+        ]
+
+
+@handler('index_posts')
+def _index_posts(payloads):
+    search_index.index_posts({payload['post_id'] for payload in payloads})
+
+
+@handler('index_comments')
+def _index_comments(payloads):
+    search_index.index_comments({payload['comment_id'] for payload in payloads})
+
+
+@handler('fan_out')
+def _fan_out(payloads):
+    fan_out({payload['post_id'] for payload in payloads})
+
+
+job_queue = JobQueue()
+metrics.add_collector(job_queue.collect)
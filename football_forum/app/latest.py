@@ -0,0 +1,159 @@
+import bisect
+import threading
+import time
+from collections import namedtuple
+
+from . import db
+from .instrumentation import metrics
+from .models import User, Team, Post
+from .pagination import decode_cursor, keyset_filter, keyset_split
+
+LatestPost = namedtuple('LatestPost', 'id team_id team_name title author timestamp')
+
+
+def _columns():
+    return (
+        db.select(Post.id, Post.team_id, Team.name.label('team_name'), Post.title,
+                  User.username.label('author'), Post.timestamp)
+        .join(Team, Team.id == Post.team_id)
+        .join(User, User.id == Post.user_id)
+    )
+
+
+class LatestPosts:
+    # Ring buffer of the newest `size` posts site-wide, ordered like the
+    # feed by (timestamp, id). Posts created in this process are pushed in
+    # as they commit; every `ttl` seconds posts committed elsewhere are
+    # pulled in by id, so a refresh reads only rows it has not seen. Pages
+    # the buffer cannot answer fall back to one keyset query on
+    # ix_posts_timestamp_id.
+
+    def __init__(self):
+        self.size = 100
+        self.ttl = 2
+        self.lock = threading.Lock()
+        self.entries = []
+        self.ids = set()
+        self.last_id = None
+        self.complete = False
+        self.refreshed_at = 0
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        app.config.setdefault('LATEST_POSTS_SIZE', 100)
+        app.config.setdefault('LATEST_POSTS_TTL', 2)
+        self.size = app.config['LATEST_POSTS_SIZE']
+        self.ttl = app.config['LATEST_POSTS_TTL']
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.entries = []
+            self.ids = set()
+            self.last_id = None
+            self.complete = False
+            self.refreshed_at = 0
+
+    def push(self, entry):
+        with self.lock:
+            self._add([entry])
+
+    def discard(self, post_ids):
+        with self.lock:
+            self._remove(post_ids)
+
+    def refresh(self):
+        # Picks up posts committed since the last refresh by id, which only
+        # touches new rows, and in the same query re-reads the buffered ids
+        # so posts deleted by another process drop out. Reloads the newest
+        # `size` from the timestamp index on first use, or when so many
+        # arrived that some may be missed.
+        if self.last_id is not None:
+            with self.lock:
+                buffered = list(self.ids)
+            rows = self._fetch(
+                _columns()
+                .where(db.or_(Post.id > self.last_id, Post.id.in_(buffered)))
+                .order_by(Post.id.desc())
+                .limit(self.size + len(buffered))
+            )
+            new = [row for row in rows if row.id > self.last_id]
+            if len(new) < self.size:
+                found = {row.id for row in rows}
+                with self.lock:
+                    self._remove(set(buffered) - found)
+                    self._add(new)
+                    self.last_id = max([self.last_id, *(row.id for row in new)])
+                    self.refreshed_at = time.monotonic()
+                return
+
+        rows = self._fetch(_columns().order_by(Post.timestamp.desc(), Post.id.desc()).limit(self.size))
+        with self.lock:
+            self.entries = sorted(rows, key=_sort_key)
+            self.ids = {row.id for row in rows}
+            # Everything fits: older pages never need the database.
+            self.complete = len(rows) < self.size
+            self.last_id = max((row.id for row in rows), default=0)
+            self.refreshed_at = time.monotonic()
+
+    def page(self, before=None, per_page=20):
+        if time.monotonic() - self.refreshed_at >= self.ttl:
+            self.refresh()
+
+        with self.lock:
+            entries = list(self.entries)
+            complete = self.complete
+        if before:
+            cursor = decode_cursor(before)
+            entries = entries[:bisect.bisect_left(entries, cursor, key=_sort_key)]
+        if complete or len(entries) > per_page:
+            with self.lock:
+                self.hits += 1
+            return keyset_split(entries[::-1][:per_page + 1], Post.timestamp, Post.id, per_page)
+
+        with self.lock:
+            self.misses += 1
+        rows = self._fetch(keyset_filter(_columns(), Post.timestamp, Post.id, before, per_page))
+        return keyset_split(rows, Post.timestamp, Post.id, per_page)
+
+    def _fetch(self, statement):
+        return [LatestPost(*row) for row in db.session.execute(statement)]
+
+    def _remove(self, post_ids):
+        gone = set(post_ids) & self.ids
+        if gone:
+            self.ids -= gone
+            self.entries = [entry for entry in self.entries if entry.id not in gone]
+
+    def _add(self, rows):
+        # The buffer must stay an unbroken run of the newest posts, so a
+        # post older than everything in it (a backdated import, say) is
+        # left to the database.
+        for entry in rows:
+            if entry.id in self.ids:
+                continue
+            if not self.complete and self.entries and _sort_key(entry) < _sort_key(self.entries[0]):
+                continue
+            bisect.insort(self.entries, entry, key=_sort_key)
+            self.ids.add(entry.id)
+        while len(self.entries) > self.size:
+            self.ids.discard(self.entries.pop(0).id)
+            self.complete = False
+
+    def collect(self):
+        with self.lock:
+            return [
+                ('forum_latest_posts_hits_total', 'counter', 'Home page feed pages served from memory.',
+                 [({}, self.hits)]),
+                ('forum_latest_posts_misses_total', 'counter', 'Home page feed pages read from the database.',
+                 [({}, self.misses)]),
+            ]
+
+
+def _sort_key(entry):
+    return (entry.timestamp, entry.id)
+
+
+latest_posts = LatestPosts()
+metrics.add_collector(latest_posts.collect)
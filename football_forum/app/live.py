@@ -0,0 +1,393 @@
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from .instrumentation import metrics
+
+
+class HubFull(Exception):
+    pass
+
+
+class MemoryHub:
+    # Fans events out to subscribers in this process. A subscriber that falls
+    # `queue_size` events behind misses the overflow rather than blocking
+    # the publisher.
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.channels = {}
+
+    def publish(self, channel, event, data):
+        with self.lock:
+            queues = list(self.channels.get(channel, ()))
+        for q in queues:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                pass
+
+    def has_subscribers(self, channel):
+        with self.lock:
+            return channel in self.channels
+
+    def subscribe(self, channel):
+        q = queue.Queue(self.queue_size)
+        with self.lock:
+            self.channels.setdefault(channel, set()).add(q)
+        return MemorySubscription(self, channel, q)
+
+    def subscribe_async(self, channel):
+        subscription = AsyncMemorySubscription(self, channel, asyncio.get_running_loop())
+        with self.lock:
+            self.channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, channel, q):
+        with self.lock:
+            queues = self.channels.get(channel)
+            if queues is not None:
+                queues.discard(q)
+                if not queues:
+                    del self.channels[channel]
+
+
+class MemorySubscription:
+    def __init__(self, hub, channel, q):
+        self.hub = hub
+        self.channel = channel
+        self.queue = q
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub._unsubscribe(self.channel, self.queue)
+
+
+class AsyncMemorySubscription:
+    # Registered with the hub like a queue; publishers run in WSGI threads, so
+    # messages are handed to the event loop thread-safely.
+
+    def __init__(self, hub, channel, loop):
+        self.hub = hub
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(hub.queue_size)
+
+    def put_nowait(self, message):
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        if not self.queue.full():
+            self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.hub._unsubscribe(self.channel, self)
+
+
+class SQLiteHub:
+    # Stand-in for multi-process deployments: publishers append to a shared
+    # file and every subscriber polls it, so an event published by one worker
+    # reaches streams held open by the others.
+
+    def __init__(self, path, poll_interval=1.0, retention=300):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(
+                'CREATE TABLE IF NOT EXISTS live_events ('
+                '  id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL,'
+                '  event TEXT NOT NULL, data TEXT NOT NULL, created_at REAL NOT NULL);'
+                'CREATE INDEX IF NOT EXISTS ix_live_events_channel_id ON live_events (channel, id);'
+                'CREATE INDEX IF NOT EXISTS ix_live_events_created_at ON live_events (created_at);'
+            )
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self.local.conn = conn
+        return conn
+
+    def publish(self, channel, event, data):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                'INSERT INTO live_events (channel, event, data, created_at) VALUES (?, ?, ?, ?)',
+                (channel, event, json.dumps(data), now),
+            )
+            conn.execute('DELETE FROM live_events WHERE created_at < ?', (now - self.retention,))
+
+    def has_subscribers(self, channel):
+        # Streams held by other processes can't be seen from here.
+        return True
+
+    def subscribe(self, channel):
+        last_id = self._connect().execute('SELECT coalesce(max(id), 0) FROM live_events').fetchone()[0]
+        return SQLiteSubscription(self, channel, last_id)
+
+    def subscribe_async(self, channel):
+        return AsyncSQLiteSubscription(self, channel)
+
+    def _poll(self, channel, last_id):
+        return self._connect().execute(
+            'SELECT id, event, data FROM live_events WHERE channel = ? AND id > ? ORDER BY id',
+            (channel, last_id),
+        ).fetchall()
+
+
+class SQLiteSubscription:
+    def __init__(self, hub, channel, last_id):
+        self.hub = hub
+        self.channel = channel
+        self.last_id = last_id
+        self.pending = []
+
+    def get(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self.pending:
+            rows = self.hub._poll(self.channel, self.last_id)
+            if rows:
+                self.last_id = rows[-1][0]
+                self.pending = [(event, json.loads(data)) for _, event, data in rows]
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(self.hub.poll_interval, remaining))
+        return self.pending.pop(0)
+
+    def close(self):
+        pass
+
+
+class AsyncSQLiteSubscription:
+    # Same polling as SQLiteSubscription, over aiosqlite so the wait does not
+    # hold a thread.
+
+    def __init__(self, hub, channel):
+        self.hub = hub
+        self.channel = channel
+        self.conn = None
+        self.last_id = None
+        self.pending = []
+
+    async def get(self, timeout):
+        if self.conn is None:
+            import aiosqlite
+
+            self.conn = await aiosqlite.connect(self.hub.path, timeout=5)
+            async with self.conn.execute('SELECT coalesce(max(id), 0) FROM live_events') as cursor:
+                self.last_id = (await cursor.fetchone())[0]
+
+        deadline = time.monotonic() + timeout
+        while not self.pending:
+            async with self.conn.execute(
+                'SELECT id, event, data FROM live_events WHERE channel = ? AND id > ? ORDER BY id',
+                (self.channel, self.last_id),
+            ) as cursor:
+                rows = await cursor.fetchall()
+            if rows:
+                self.last_id = rows[-1][0]
+                self.pending = [(event, json.loads(data)) for _, event, data in rows]
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(self.hub.poll_interval, remaining))
+        return self.pending.pop(0)
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+
+
+class NullHub:
+    def publish(self, channel, event, data):
+        pass
+
+    def has_subscribers(self, channel):
+        return False
+
+    def subscribe(self, channel):
+        return NullSubscription()
+
+
+class NullSubscription:
+    def get(self, timeout):
+        time.sleep(timeout)
+        return None
+
+    def close(self):
+        pass
+
+
+class LiveUpdates:
+    # Server-Sent Events for open thread pages. Each stream holds a worker
+    # thread, so at most `max_connections` are open per process, and one
+    # that delivers nothing for `idle_timeout` seconds is closed (browsers
+    # reconnect on their own). Off unless a backend is configured; asgi.py
+    # turns on the memory hub, where a stream costs a socket instead.
+
+    def __init__(self):
+        self.hub = NullHub()
+        self.max_connections = 0
+        self.idle_timeout = 0
+        self.keepalive = 15
+        self.lock = threading.Lock()
+        self.open = 0
+        self.rejected = 0
+
+    def init_app(self, app):
+        app.config.setdefault('LIVE_UPDATES_BACKEND', 'null')
+        app.config.setdefault('LIVE_UPDATES_PATH', os.path.join(app.instance_path, 'live.db'))
+        app.config.setdefault('LIVE_UPDATES_POLL_INTERVAL', 1.0)
+        app.config.setdefault('LIVE_UPDATES_MAX_CONNECTIONS', 100)
+        app.config.setdefault('LIVE_UPDATES_IDLE_TIMEOUT', 300)
+        app.config.setdefault('LIVE_UPDATES_KEEPALIVE', 15)
+
+        hub = app.config['LIVE_UPDATES_BACKEND']
+        if hub == 'memory':
+            hub = MemoryHub()
+        elif hub == 'sqlite':
+            os.makedirs(os.path.dirname(app.config['LIVE_UPDATES_PATH']), exist_ok=True)
+            hub = SQLiteHub(app.config['LIVE_UPDATES_PATH'], app.config['LIVE_UPDATES_POLL_INTERVAL'])
+        elif hub in (None, 'null'):
+            hub = NullHub()
+        self.hub = hub
+        self.max_connections = app.config['LIVE_UPDATES_MAX_CONNECTIONS']
+        self.idle_timeout = app.config['LIVE_UPDATES_IDLE_TIMEOUT']
+        self.keepalive = app.config['LIVE_UPDATES_KEEPALIVE']
+
+    @property
+    def enabled(self):
+        return not isinstance(self.hub, NullHub)
+
+    def publish(self, channel, event, data):
+        self.hub.publish(channel, event, data)
+
+    def has_subscribers(self, channel):
+        return self.hub.has_subscribers(channel)
+
+    def stream(self, channel):
+        # Returns an iterable of SSE text; raises HubFull when the process
+        # already holds max_connections streams.
+        self._acquire()
+        try:
+            subscription = self.hub.subscribe(channel)
+        except Exception:
+            self._release()
+            raise
+        return _EventStream(self, subscription)
+
+    def stream_async(self, channel):
+        # As stream(), for the ASGI server: returns an async iterable with an
+        # async close().
+        self._acquire()
+        try:
+            subscription = self.hub.subscribe_async(channel)
+        except Exception:
+            self._release()
+            raise
+        return _AsyncEventStream(self, subscription)
+
+    def _acquire(self):
+        with self.lock:
+            if self.open >= self.max_connections:
+                self.rejected += 1
+                raise HubFull()
+            self.open += 1
+
+    def _release(self):
+        with self.lock:
+            self.open -= 1
+
+    def collect(self):
+        with self.lock:
+            return [
+                ('forum_live_streams_open', 'gauge', 'Server-Sent Event streams currently open.', [({}, self.open)]),
+                ('forum_live_streams_rejected_total', 'counter',
+                 'Event streams refused because the connection limit was reached.', [({}, self.rejected)]),
+            ]
+
+
+class _EventStream:
+    # An iterable rather than a generator so the connection slot is released
+    # through close() even if the server never starts iterating.
+
+    def __init__(self, live, subscription):
+        self.live = live
+        self.subscription = subscription
+        self.closed = False
+
+    def __iter__(self):
+        yield 'retry: 5000\n\n'
+        idle_until = time.monotonic() + self.live.idle_timeout
+        while time.monotonic() < idle_until:
+            wait = min(self.live.keepalive, idle_until - time.monotonic())
+            message = self.subscription.get(max(wait, 0.01))
+            if message is not None:
+                idle_until = time.monotonic() + self.live.idle_timeout
+            yield _format(message)
+        self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.subscription.close()
+            self.live._release()
+
+
+class _AsyncEventStream:
+    def __init__(self, live, subscription):
+        self.live = live
+        self.subscription = subscription
+        self.closed = False
+
+    async def __aiter__(self):
+        yield 'retry: 5000\n\n'
+        idle_until = time.monotonic() + self.live.idle_timeout
+        while time.monotonic() < idle_until:
+            wait = min(self.live.keepalive, idle_until - time.monotonic())
+            message = await self.subscription.get(max(wait, 0.01))
+            if message is not None:
+                idle_until = time.monotonic() + self.live.idle_timeout
+            yield _format(message)
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            await self.subscription.close()
+            self.live._release()
+
+
+def _format(message):
+    if message is None:
+        return ': keepalive\n\n'
+    event, data = message
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+live_updates = LiveUpdates()
+metrics.add_collector(live_updates.collect)
@@ -1,14 +1,27 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, current_app, render_template, request
 from flask_login import login_required, current_user
 
+from .feed import read_feed
+from .instrumentation import query_budget
+from .latest import latest_posts
+from .replicas import replica_reads
+
 main = Blueprint('main', __name__)
 
 @main.route('/')
+@query_budget(2)
 def index():
-    return render_template('index.html')
+    posts, next_cursor = latest_posts.page(
+        before=request.args.get('before'), per_page=current_app.config['POSTS_PER_PAGE']
+    )
+    return render_template('index.html', posts=posts, next_cursor=next_cursor)
 
 @main.route('/dashboard')
 @login_required
+@replica_reads
+@query_budget(4)
 def dashboard():
-    return render_template('dashboard.html', username=current_user.username)
-
+    posts, next_cursor = read_feed(
+        current_user.id, before=request.args.get('before'), per_page=current_app.config['POSTS_PER_PAGE']
+    )
+    return render_template('dashboard.html', username=current_user.username, posts=posts, next_cursor=next_cursor)
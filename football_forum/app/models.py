@@ -1,7 +1,9 @@
 
 
 from flask_login import UserMixin
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from . import db
+from .ranking import NEW_POST_HOT_SCORE
 from datetime import datetime
 
 class User(db.Model, UserMixin):
@@ -10,6 +12,7 @@ class User(db.Model, UserMixin):
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=True)
     password = db.Column(db.String(200), nullable=False)
+    is_moderator = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     
     posts = db.relationship('Post', backref='author', lazy=True)
     comments = db.relationship('Comment', backref='author', lazy=True)
@@ -19,10 +22,19 @@ class Team(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.Text, nullable=True)
+    follower_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Posts fanned out since the followers' timelines were last trimmed.
+    untrimmed_posts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     posts = db.relationship('Post', backref='team', lazy=True)
 
 class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (
+        db.Index('ix_posts_team_id_timestamp_id', 'team_id', db.desc('timestamp'), db.desc('id')),
+        db.Index('ix_posts_team_id_hot_score_id', 'team_id', db.desc('hot_score'), db.desc('id')),
+        db.Index('ix_posts_timestamp_id', db.desc('timestamp'), db.desc('id')),
+        db.Index('ix_posts_user_id', 'user_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
@@ -31,39 +43,213 @@ class Post(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
 
-    comments = db.relationship('Comment', backref='post', lazy=True, cascade='all, delete-orphan')
-    votes = db.relationship('PostVote', backref='post', lazy=True, cascade='all, delete-orphan')
+    vote_score = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    hot_score = db.Column(db.Float, nullable=False, default=NEW_POST_HOT_SCORE, server_default='0')
+    locked = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
 
-    @property
-    def vote_score(self):
-        return sum(v.value for v in self.votes)
+    # Children are removed by ON DELETE CASCADE in the database rather than
+    # loaded and deleted one by one.
+    comments = db.relationship('Comment', backref='post', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    votes = db.relationship('PostVote', backref='post', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+    @classmethod
+    def bump_comment_count(cls, post_id):
+        db.session.execute(
+            db.update(cls)
+            .where(cls.id == post_id)
+            .values(
+                comment_count=cls.comment_count + 1,
+                hot_score=db.func.hot_score(cls.vote_score, cls.comment_count + 1, cls.timestamp),
+            )
+        )
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        db.Index('ix_comments_post_id_timestamp', 'post_id', 'timestamp'),
+        db.Index('ix_comments_user_id', 'user_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), nullable=False)
 
-    votes = db.relationship('CommentVote', backref='comment', lazy=True, cascade='all, delete-orphan')
+    vote_score = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
-    @property
-    def vote_score(self):
-        return sum(v.value for v in self.votes)
+    votes = db.relationship('CommentVote', backref='comment', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
 class PostVote(db.Model):
     __tablename__ = 'post_votes'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='uq_post_votes_user_id_post_id'),
+        db.Index('ix_post_votes_post_id', 'post_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     value = db.Column(db.Integer, default=1)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), nullable=False)
+
+    @classmethod
+    def cast(cls, user_id, post_id, value=1):
+        # Returns True if this is the user's first vote on the post.
+        result = db.session.execute(
+            sqlite_insert(cls)
+            .values(user_id=user_id, post_id=post_id, value=value)
+            .on_conflict_do_nothing(index_elements=['user_id', 'post_id'])
+        )
+        if result.rowcount != 1:
+            return False
+        db.session.execute(
+            db.update(Post)
+            .where(Post.id == post_id)
+            .values(
+                vote_score=Post.vote_score + value,
+                hot_score=db.func.hot_score(Post.vote_score + value, Post.comment_count, Post.timestamp),
+            )
+        )
+        return True
 
 class CommentVote(db.Model):
     __tablename__ = 'comment_votes'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'comment_id', name='uq_comment_votes_user_id_comment_id'),
+        db.Index('ix_comment_votes_comment_id', 'comment_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     value = db.Column(db.Integer, default=1)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    comment_id = db.Column(db.Integer, db.ForeignKey('comments.id'), nullable=False)
+    comment_id = db.Column(db.Integer, db.ForeignKey('comments.id', ondelete='CASCADE'), nullable=False)
+
+    @classmethod
+    def cast(cls, user_id, comment_id, value=1):
+        # Returns True if this is the user's first vote on the comment.
+        result = db.session.execute(
+            sqlite_insert(cls)
+            .values(user_id=user_id, comment_id=comment_id, value=value)
+            .on_conflict_do_nothing(index_elements=['user_id', 'comment_id'])
+        )
+        if result.rowcount != 1:
+            return False
+        db.session.execute(
+            db.update(Comment).where(Comment.id == comment_id).values(vote_score=Comment.vote_score + value)
+        )
+        return True
+
+class TeamStats(db.Model):
+    # Per-team totals for the teams index, bumped in the same transaction as
+    # the post or comment that changes them. `flask forum rebuild-team-stats`
+    # recomputes them from the source tables.
+    __tablename__ = 'team_stats'
+    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), primary_key=True)
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_activity_at = db.Column(db.DateTime, nullable=True)
+
+    @classmethod
+    def record(cls, team_id, timestamp, posts=0, comments=0):
+        statement = sqlite_insert(cls).values(
+            team_id=team_id, post_count=posts, comment_count=comments, last_activity_at=timestamp
+        )
+        excluded = statement.excluded
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['team_id'],
+            set_={
+                'post_count': cls.post_count + excluded.post_count,
+                'comment_count': cls.comment_count + excluded.comment_count,
+                'last_activity_at': db.func.max(
+                    db.func.coalesce(cls.last_activity_at, excluded.last_activity_at), excluded.last_activity_at
+                ),
+            },
+        ))
+
+class TeamFollow(db.Model):
+    __tablename__ = 'team_follows'
+    __table_args__ = (
+        db.Index('ix_team_follows_team_id_user_id', 'team_id', 'user_id'),
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class TimelineEntry(db.Model):
+    # One row per (follower, post), written when the post is fanned out.
+    # `timestamp` is the post's, so a page of the feed is one range scan
+    # of the (user_id, timestamp, post_id) index.
+    __tablename__ = 'timeline_entries'
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_id_timestamp_post_id', 'user_id', db.desc('timestamp'), db.desc('post_id')),
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+
+class Job(db.Model):
+    # Deferred work for `flask forum worker`; see app/jobs.py.
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_failed_at_run_at', 'failed_at', 'run_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    failed_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+def rebuild_counters():
+    post_totals = (
+        db.select(db.func.coalesce(db.func.sum(PostVote.value), 0))
+        .where(PostVote.post_id == Post.id)
+        .scalar_subquery()
+    )
+    comment_totals = (
+        db.select(db.func.coalesce(db.func.sum(CommentVote.value), 0))
+        .where(CommentVote.comment_id == Comment.id)
+        .scalar_subquery()
+    )
+    comment_counts = (
+        db.select(db.func.count(Comment.id))
+        .where(Comment.post_id == Post.id)
+        .scalar_subquery()
+    )
+    posts = db.session.execute(
+        db.update(Post).values(vote_score=post_totals, comment_count=comment_counts)
+    ).rowcount
+    comments = db.session.execute(db.update(Comment).values(vote_score=comment_totals)).rowcount
+    return posts, comments
+
 
+def rebuild_team_stats():
+    post_counts = db.select(db.func.count(Post.id)).where(Post.team_id == Team.id).scalar_subquery()
+    comment_counts = (
+        db.select(db.func.count(Comment.id))
+        .join(Post, Post.id == Comment.post_id)
+        .where(Post.team_id == Team.id)
+        .scalar_subquery()
+    )
+    last_post = db.select(db.func.max(Post.timestamp)).where(Post.team_id == Team.id).scalar_subquery()
+    last_comment = (
+        db.select(db.func.max(Comment.timestamp))
+        .join(Post, Post.id == Comment.post_id)
+        .where(Post.team_id == Team.id)
+        .scalar_subquery()
+    )
+    db.session.execute(db.delete(TeamStats))
+    return db.session.execute(
+        db.insert(TeamStats).from_select(
+            ['team_id', 'post_count', 'comment_count', 'last_activity_at'],
+            db.select(
+                Team.id, post_counts, comment_counts,
+                # SQLite's two-argument max() is NULL if either side is.
+                db.func.max(db.func.coalesce(last_post, last_comment), db.func.coalesce(last_comment, last_post)),
+            ),
+        )
+    ).rowcount
@@ -0,0 +1,180 @@
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import abort
+from flask_login import current_user
+
+from . import db
+from .fragment_cache import fragment_cache
+from .latest import latest_posts
+from .models import User, Post, Comment, PostVote, CommentVote, TeamStats
+from .ranking import refresh_post_hot_scores
+from . import search as search_index
+
+
+def moderator_required(view):
+    # Goes under @login_required, which deals with anonymous users. The
+    # flag is read from the database, not the cached user, so a revoke
+    # takes effect at once in every process.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not db.session.scalar(db.select(User.is_moderator).where(User.id == current_user.id)):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def set_locked(post_id, locked):
+    return db.session.execute(db.update(Post).where(Post.id == post_id).values(locked=locked)).rowcount == 1
+
+
+def delete_posts(post_ids):
+    # One DELETE for the lot: comments, votes and timeline entries go with
+    # the posts through ON DELETE CASCADE, so none of them are loaded.
+    # Team totals are taken from the stored counters. Returns the ids of the
+    # teams touched; pass them to forget() once the transaction commits.
+    post_ids = list(post_ids)
+    totals = db.session.execute(
+        db.select(Post.team_id, db.func.count(), db.func.sum(Post.comment_count))
+        .where(Post.id.in_(post_ids))
+        .group_by(Post.team_id)
+    ).all()
+    if not totals:
+        return set()
+    _subtract_team_stats(totals)
+    search_index.remove_posts(post_ids)
+    db.session.execute(db.delete(Post).where(Post.id.in_(post_ids)))
+    return {team_id for team_id, _, _ in totals}
+
+
+def delete_comments(comment_ids):
+    comment_ids = list(comment_ids)
+    totals = db.session.execute(
+        db.select(Comment.post_id, Post.team_id, db.func.count())
+        .join(Post, Post.id == Comment.post_id)
+        .where(Comment.id.in_(comment_ids))
+        .group_by(Comment.post_id)
+    ).all()
+    if not totals:
+        return set()
+    posts = Post.__table__
+    db.session.execute(
+        posts.update().where(posts.c.id == db.bindparam('post'))
+        .values(comment_count=posts.c.comment_count - db.bindparam('comments')),
+        [{'post': post_id, 'comments': count} for post_id, _, count in totals],
+    )
+    per_team = Counter()
+    for _, team_id, count in totals:
+        per_team[team_id] += count
+    _subtract_team_stats([(team_id, 0, count) for team_id, count in per_team.items()])
+    search_index.remove_comments(comment_ids)
+    db.session.execute(db.delete(Comment).where(Comment.id.in_(comment_ids)))
+    refresh_post_hot_scores([post_id for post_id, _, _ in totals])
+    return set(per_team)
+
+
+def delete_post_votes(vote_ids):
+    totals = db.session.execute(
+        db.select(PostVote.post_id, Post.team_id, db.func.sum(PostVote.value))
+        .join(Post, Post.id == PostVote.post_id)
+        .where(PostVote.id.in_(vote_ids))
+        .group_by(PostVote.post_id)
+    ).all()
+    posts = Post.__table__
+    if totals:
+        db.session.execute(
+            posts.update().where(posts.c.id == db.bindparam('post'))
+            .values(vote_score=posts.c.vote_score - db.bindparam('score')),
+            [{'post': post_id, 'score': score} for post_id, _, score in totals],
+        )
+    db.session.execute(db.delete(PostVote).where(PostVote.id.in_(vote_ids)))
+    refresh_post_hot_scores([post_id for post_id, _, _ in totals])
+    return {team_id for _, team_id, _ in totals}
+
+
+def delete_comment_votes(vote_ids):
+    totals = db.session.execute(
+        db.select(CommentVote.comment_id, db.func.sum(CommentVote.value))
+        .where(CommentVote.id.in_(vote_ids))
+        .group_by(CommentVote.comment_id)
+    ).all()
+    comments = Comment.__table__
+    if totals:
+        db.session.execute(
+            comments.update().where(comments.c.id == db.bindparam('comment'))
+            .values(vote_score=comments.c.vote_score - db.bindparam('score')),
+            [{'comment': comment_id, 'score': score} for comment_id, score in totals],
+        )
+    db.session.execute(db.delete(CommentVote).where(CommentVote.id.in_(vote_ids)))
+    return set()
+
+
+def forget(team_ids, post_ids=()):
+    # Drops cached copies of deleted content; call after the commit.
+    latest_posts.discard(post_ids)
+    fragment_cache.invalidate('teams', *(f'team:{team_id}:{sort}' for team_id in team_ids for sort in ('new', 'hot')))
+
+
+def purge(user_id=None, since=None, until=None, batch_size=500, pause=0.1, log=print):
+    # Deletes posts, then the remaining comments, and for a user also their
+    # votes, `batch_size` rows per transaction. Each batch commits on its
+    # own and the purge sleeps `pause` seconds before the next, so the write
+    # lock is only ever held for one batch and other writers get a turn.
+    # Votes carry no timestamp, so a date range alone leaves them alone.
+    # Rows are walked in id order from where the last batch stopped, so
+    # the whole purge reads each table at most once.
+    steps = [
+        ('posts', Post, _filters(Post, user_id, since, until), delete_posts),
+        ('comments', Comment, _filters(Comment, user_id, since, until), delete_comments),
+    ]
+    if user_id is not None:
+        steps += [
+            ('post votes', PostVote, [PostVote.user_id == user_id], delete_post_votes),
+            ('comment votes', CommentVote, [CommentVote.user_id == user_id], delete_comment_votes),
+        ]
+
+    counts = {}
+    for name, model, filters, delete in steps:
+        counts[name] = 0
+        last_id = 0
+        while True:
+            ids = db.session.scalars(
+                db.select(model.id).where(*filters, model.id > last_id).order_by(model.id).limit(batch_size)
+            ).all()
+            if not ids:
+                break
+            team_ids = delete(ids)
+            db.session.commit()
+            forget(team_ids, ids if model is Post else ())
+            counts[name] += len(ids)
+            last_id = ids[-1]
+            if len(ids) < batch_size:
+                break
+            time.sleep(pause)
+        log(f'{name}: {counts[name]} deleted')
+    return counts
+
+
+def _filters(model, user_id, since, until):
+    filters = []
+    if user_id is not None:
+        filters.append(model.user_id == user_id)
+    if since is not None:
+        filters.append(model.timestamp >= since)
+    if until is not None:
+        filters.append(model.timestamp < until)
+    return filters
+
+
+def _subtract_team_stats(totals):
+    # `last_activity_at` is left alone; rebuild-team-stats recomputes it.
+    stats = TeamStats.__table__
+    db.session.execute(
+        stats.update().where(stats.c.team_id == db.bindparam('team'))
+        .values(
+            post_count=stats.c.post_count - db.bindparam('posts'),
+            comment_count=stats.c.comment_count - db.bindparam('comments'),
+        ),
+        [{'team': team_id, 'posts': posts, 'comments': comments} for team_id, posts, comments in totals],
+    )
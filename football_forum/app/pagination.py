@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from flask import abort
+
+from . import db
+
+
+def encode_cursor(key, id):
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    else:
+        key = repr(key)
+    return f'{key},{id}'
+
+
+def decode_cursor(value, key_type=datetime):
+    try:
+        key, id = value.rsplit(',', 1)
+        if key_type is datetime:
+            return datetime.fromisoformat(key), int(id)
+        return key_type(key), int(id)
+    except ValueError:
+        abort(400)
+
+
+def keyset_page(query, key_column, id_column, before=None, per_page=20):
+    # Newest-first (or highest-first) page ordered by (key, id); `before` is
+    # the cursor returned for the previous page.
+    rows = keyset_filter(query, key_column, id_column, before, per_page).all()
+    return keyset_split(rows, key_column, id_column, per_page)
+
+
+def keyset_filter(query, key_column, id_column, before=None, per_page=20):
+    # Works on both Query and select(), so async callers can execute the
+    # statement themselves and pass the rows to keyset_split().
+    if before:
+        key, id = decode_cursor(before, key_column.type.python_type)
+        query = query.filter(db.tuple_(key_column, id_column) < db.tuple_(key, id))
+    return query.order_by(key_column.desc(), id_column.desc()).limit(per_page + 1)
+
+
+def keyset_split(rows, key_column, id_column, per_page=20):
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, key_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
@@ -0,0 +1,118 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from .instrumentation import metrics
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def normalize_method(method):
+    # Spell out werkzeug's implicit defaults so a stored hash's prefix can be
+    # compared with the configured method.
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2':
+        if len(parts) == 1:
+            parts.append('sha256')
+        if len(parts) == 2:
+            parts.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    elif parts[0] == 'scrypt' and len(parts) == 1:
+        parts.extend(['32768', '8', '1'])
+    return ':'.join(parts)
+
+
+class PasswordHasher:
+    # Runs password hashing in a small process pool so that a burst of logins
+    # neither holds the GIL nor queues without limit: once `queue_size`
+    # requests are waiting, callers get HasherBusy straight away.
+
+    def __init__(self):
+        self.method = normalize_method('pbkdf2:sha256')
+        self.workers = 0
+        self.timeout = None
+        self.slots = None
+        self.executor = None
+        self.lock = threading.Lock()
+        self.rejected = 0
+        self.timed_out = 0
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('PASSWORD_HASH_QUEUE_SIZE', 4 * app.config['PASSWORD_HASH_WORKERS'])
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+
+        self.shutdown()
+        self.method = normalize_method(app.config['PASSWORD_HASH_METHOD'])
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self.slots = threading.BoundedSemaphore(max(app.config['PASSWORD_HASH_QUEUE_SIZE'], 1))
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+
+        slots = self.slots
+        if not slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise HasherBusy()
+        try:
+            future = self._executor().submit(func, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # The slot stays taken until the pool is done with the task, even if
+        # this request stops waiting for it, so `queue_size` really bounds
+        # the work queued in the pool.
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self.lock:
+                self.timed_out += 1
+            raise HasherBusy() from None
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                # spawn rather than fork: the web process may already be
+                # running threads that hold locks.
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self.executor
+
+    def collect(self):
+        with self.lock:
+            return [
+                ('forum_password_hash_rejected_total', 'counter',
+                 'Password hash requests refused because the queue was full.', [({}, self.rejected)]),
+                ('forum_password_hash_timeouts_total', 'counter',
+                 'Password hash requests that gave up after PASSWORD_HASH_TIMEOUT.', [({}, self.timed_out)]),
+            ]
+
+
+password_hasher = PasswordHasher()
+metrics.add_collector(password_hasher.collect)
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+from . import db
+
+HOT_GRAVITY = 1.8
+COMMENT_WEIGHT = 2
+HOT_WINDOW = timedelta(days=7)
+
+
+def hot_score(vote_score, comment_count, timestamp, now=None):
+    # Activity decays with age, so the ranking drifts towards newer threads
+    # unless older ones keep attracting votes and comments.
+    now = now or datetime.utcnow()
+    age_hours = max((now - timestamp).total_seconds() / 3600, 0)
+    points = (vote_score or 0) + COMMENT_WEIGHT * (comment_count or 0)
+    return (points + 1) / (age_hours + 2) ** HOT_GRAVITY
+
+
+NEW_POST_HOT_SCORE = hot_score(0, 0, datetime(2000, 1, 1), now=datetime(2000, 1, 1))
+
+
+def _hot_score_sql(vote_score, comment_count, timestamp):
+    if timestamp is None:
+        return 0.0
+    return hot_score(vote_score, comment_count, datetime.fromisoformat(timestamp))
+
+
+def register_sql_functions(dbapi_connection, connection_record):
+    # Lets UPDATE statements recompute posts.hot_score in the same statement
+    # that bumps the counters it depends on.
+    dbapi_connection.create_function('hot_score', 3, _hot_score_sql)
+
+
+def refresh_hot_scores(window=HOT_WINDOW, batch_size=1000):
+    from .models import Post
+
+    cutoff = datetime.utcnow() - window
+    updated = _floor_stale_hot_scores(cutoff, batch_size)
+    ids = db.session.execute(
+        db.select(db.func.min(Post.id), db.func.max(Post.id)).where(Post.timestamp >= cutoff)
+    ).one()
+    if ids[0] is None:
+        return updated
+
+    for start in range(ids[0], ids[1] + 1, batch_size):
+        updated += db.session.execute(
+            db.update(Post)
+            .where(Post.id.between(start, start + batch_size - 1), Post.timestamp >= cutoff)
+            .values(hot_score=db.func.hot_score(Post.vote_score, Post.comment_count, Post.timestamp))
+        ).rowcount
+        db.session.commit()
+    return updated
+
+
+def _floor_stale_hot_scores(cutoff, batch_size):
+    # Posts that have left the window are no longer decayed, so their last
+    # score is set to the floor instead of lingering above newer threads.
+    # Per team, positive scores are a prefix of the (team_id, hot_score)
+    # index, so this only reads posts that still have one.
+    from .models import Post, Team
+
+    updated = 0
+    for team_id in db.session.scalars(db.select(Team.id)).all():
+        while True:
+            stale = (
+                db.select(Post.id)
+                .where(Post.team_id == team_id, Post.hot_score > 0, Post.timestamp < cutoff)
+                .limit(batch_size)
+            )
+            count = db.session.execute(
+                db.update(Post).where(Post.id.in_(stale)).values(hot_score=0)
+            ).rowcount
+            db.session.commit()
+            updated += count
+            if count < batch_size:
+                break
+    return updated
+
+
+def refresh_post_hot_scores(post_ids):
+    # Returns the ids of the teams whose hot boards changed.
+    from .models import Post
+
+    rows = db.session.execute(
+        db.update(Post)
+        .where(Post.id.in_(post_ids))
+        .values(hot_score=db.func.hot_score(Post.vote_score, Post.comment_count, Post.timestamp))
+        .returning(Post.team_id)
+    ).all()
+    return {row.team_id for row in rows}
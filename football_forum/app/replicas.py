@@ -0,0 +1,195 @@
+import functools
+import random
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, has_request_context, request, session
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from werkzeug.exceptions import NotFound
+
+from . import db
+from .instrumentation import metrics
+
+STICKY_KEY = '_primary_until'
+
+
+class ReplicaRouter:
+    # Picks a replica for read-only requests. A replica's lag is the age of
+    # its last sync, which `flask forum sync-replicas` stamps into its
+    # PRAGMA user_version; it is re-read every `check_interval` seconds.
+    # Replicas that lag more than `max_lag` seconds or fail to answer are
+    # skipped until a later check passes; with none left, reads go to the
+    # primary.
+
+    def __init__(self):
+        self.replicas = ()
+        self.max_lag = 0
+        self.check_interval = 0
+        self.sticky = 0
+        self.lock = threading.Lock()
+        self.status = {}
+        self.reads = defaultdict(int)
+        self.failovers = 0
+
+    def init_app(self, app):
+        app.config.setdefault('DATABASE_REPLICAS', ())
+        app.config.setdefault('DATABASE_REPLICA_MAX_LAG', 30)
+        app.config.setdefault('DATABASE_REPLICA_CHECK_INTERVAL', 5)
+        app.config.setdefault('DATABASE_STICKY_SECONDS', 30)
+
+        replicas = app.config['DATABASE_REPLICAS']
+        if isinstance(replicas, str):
+            replicas = [key.strip() for key in replicas.split(',') if key.strip()]
+        missing = set(replicas) - set(app.config.get('SQLALCHEMY_BINDS') or {})
+        if missing:
+            raise RuntimeError(f'DATABASE_REPLICAS not in SQLALCHEMY_BINDS: {", ".join(sorted(missing))}')
+
+        self.replicas = tuple(replicas)
+        self.max_lag = app.config['DATABASE_REPLICA_MAX_LAG']
+        self.check_interval = app.config['DATABASE_REPLICA_CHECK_INTERVAL']
+        self.sticky = app.config['DATABASE_STICKY_SECONDS']
+        with self.lock:
+            self.status.clear()
+
+        if self.replicas:
+            app.after_request(_stick_to_primary)
+            if not event.contains(db.session, 'after_flush', _note_flush):
+                event.listen(db.session, 'after_flush', _note_flush)
+                event.listen(db.session, 'do_orm_execute', _note_execute)
+
+    def choose(self):
+        # Writers read from the primary for `sticky` seconds after their last
+        # write, so they always see it.
+        if not self.replicas or request.method not in ('GET', 'HEAD'):
+            return None
+        if session.get(STICKY_KEY, 0) > time.time():
+            return None
+        healthy = [key for key in self.replicas if self.healthy(key)]
+        return random.choice(healthy) if healthy else None
+
+    def healthy(self, key):
+        now = time.monotonic()
+        with self.lock:
+            state = self.status.get(key)
+            if state is not None and now - state[0] < self.check_interval:
+                return state[1]
+        try:
+            lag = self.lag(key)
+        except DBAPIError:
+            lag = None
+        with self.lock:
+            self.status[key] = (now, lag is not None and lag <= self.max_lag, lag)
+            return self.status[key][1]
+
+    def lag(self, key):
+        with db.engines[key].connect() as conn:
+            synced_at = conn.exec_driver_sql('PRAGMA user_version').scalar()
+        return max(time.time() - synced_at, 0) if synced_at else float('inf')
+
+    def mark_down(self, key):
+        with self.lock:
+            self.status[key] = (time.monotonic(), False, None)
+            self.failovers += 1
+
+    def count(self, target):
+        with self.lock:
+            self.reads[target] += 1
+
+    def collect(self):
+        with self.lock:
+            status = dict(self.status)
+            reads = dict(self.reads)
+            failovers = self.failovers
+        return [
+            ('forum_db_routed_reads_total', 'counter', 'Read-only requests by database they were sent to.',
+             [({'target': target}, count) for target, count in sorted(reads.items())]),
+            ('forum_db_replica_healthy', 'gauge', 'Whether a replica passed its last lag check.',
+             [({'replica': key}, int(status[key][1])) for key in self.replicas if key in status]),
+            ('forum_db_replica_lag_seconds', 'gauge', 'Age of the last sync seen on each replica.',
+             [({'replica': key}, status[key][2]) for key in self.replicas
+              if key in status and status[key][2] not in (None, float('inf'))]),
+            ('forum_db_replica_failovers_total', 'counter', 'Replica errors that sent a request back to the primary.',
+             [({}, failovers)]),
+        ]
+
+
+def replica_reads(view):
+    # For read-only views. Runs the view against a replica when one is
+    # healthy and the client has no recent write. If the replica errors,
+    # or lags enough to miss the requested row, the view is run again on
+    # the primary. Goes above @query_budget, so the lag check is not
+    # charged to the view.
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        key = replica_router.choose()
+        if key is None:
+            replica_router.count('primary')
+            return view(*args, **kwargs)
+
+        g.db_replica = key
+        try:
+            response = view(*args, **kwargs)
+        except DBAPIError:
+            replica_router.mark_down(key)
+        except NotFound:
+            pass
+        else:
+            replica_router.count(key)
+            return response
+
+        db.session.rollback()
+        g.db_replica = None
+        replica_router.count('primary')
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def reading_from_replica():
+    return g.get('db_replica') is not None
+
+
+def sync_replica(source_engine, replica_engine):
+    # Copies the primary into a replica file with SQLite's online backup and
+    # stamps the copy with the time it was taken.
+    synced_at = int(time.time())
+    source = sqlite3.connect(_sqlite_path(source_engine))
+    target = sqlite3.connect(_sqlite_path(replica_engine))
+    try:
+        source.backup(target)
+        target.execute(f'PRAGMA user_version = {synced_at}')
+        target.commit()
+    finally:
+        target.close()
+        source.close()
+    return synced_at
+
+
+def _sqlite_path(engine):
+    path = engine.url.database
+    return path[len('file:'):] if path.startswith('file:') else path
+
+
+def _note_flush(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def _note_execute(orm_execute_state):
+    # Bulk statements such as the vote inserts bypass the flush.
+    if has_request_context() and (
+        orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete
+    ):
+        g.db_wrote = True
+
+
+def _stick_to_primary(response):
+    if g.get('db_wrote'):
+        session[STICKY_KEY] = time.time() + replica_router.sticky
+    return response
+
+
+replica_router = ReplicaRouter()
+metrics.add_collector(replica_router.collect)
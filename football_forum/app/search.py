@@ -0,0 +1,140 @@
+import re
+
+from markupsafe import Markup, escape
+
+from . import db
+
+# Posts and comments share one FTS5 table. Rowids are derived from the source
+# row so entries can be replaced or deleted without scanning the index:
+# post N is stored at rowid 2N and comment N at rowid 2N + 1.
+CREATE_SEARCH_INDEX = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5('
+    'title, content, post_id UNINDEXED, team_id UNINDEXED, '
+    "tokenize = 'porter unicode61')"
+)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_END = '\x03'
+
+
+def post_rowid(post_id):
+    return post_id * 2
+
+
+def comment_rowid(comment_id):
+    return comment_id * 2 + 1
+
+
+def index_posts(post_ids):
+    # Indexes (or reindexes) the given posts from their stored rows; ids
+    # whose post has since been deleted are skipped.
+    db.session.execute(
+        db.text(
+            'INSERT OR REPLACE INTO search_index (rowid, title, content, post_id, team_id) '
+            'SELECT id * 2, title, content, id, team_id FROM posts WHERE id IN :ids'
+        ).bindparams(db.bindparam('ids', expanding=True)),
+        {'ids': list(post_ids)},
+    )
+
+
+def index_comments(comment_ids):
+    db.session.execute(
+        db.text(
+            'INSERT OR REPLACE INTO search_index (rowid, title, content, post_id, team_id) '
+            "SELECT comments.id * 2 + 1, '', comments.content, comments.post_id, posts.team_id "
+            'FROM comments JOIN posts ON posts.id = comments.post_id WHERE comments.id IN :ids'
+        ).bindparams(db.bindparam('ids', expanding=True)),
+        {'ids': list(comment_ids)},
+    )
+
+
+def remove_posts(post_ids):
+    # Drops the posts and all of their comments by rowid; run it before
+    # the rows themselves are deleted.
+    db.session.execute(
+        db.text(
+            'DELETE FROM search_index WHERE rowid IN ('
+            'SELECT id * 2 FROM posts WHERE id IN :ids '
+            'UNION ALL SELECT id * 2 + 1 FROM comments WHERE post_id IN :ids)'
+        ).bindparams(db.bindparam('ids', expanding=True)),
+        {'ids': list(post_ids)},
+    )
+
+
+def remove_comments(comment_ids):
+    db.session.execute(
+        db.text('DELETE FROM search_index WHERE rowid IN :rowids').bindparams(db.bindparam('rowids', expanding=True)),
+        {'rowids': [comment_rowid(comment_id) for comment_id in comment_ids]},
+    )
+
+
+def rebuild_search_index():
+    db.session.execute(db.text(CREATE_SEARCH_INDEX))
+    db.session.execute(db.text('DELETE FROM search_index'))
+    posts = db.session.execute(db.text(
+        'INSERT INTO search_index (rowid, title, content, post_id, team_id) '
+        'SELECT id * 2, title, content, id, team_id FROM posts'
+    )).rowcount
+    comments = db.session.execute(db.text(
+        'INSERT INTO search_index (rowid, title, content, post_id, team_id) '
+        "SELECT comments.id * 2 + 1, '', comments.content, comments.post_id, posts.team_id "
+        'FROM comments JOIN posts ON posts.id = comments.post_id'
+    )).rowcount
+    db.session.execute(db.text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+    return posts, comments
+
+
+def build_match_query(terms):
+    # Quote every token so user input can never be parsed as FTS5 syntax.
+    tokens = _TOKEN_RE.findall(terms or '')
+    return ' '.join(f'"{token}"' for token in tokens)
+
+
+def search(terms, team_id=None, page=1, per_page=20):
+    match = build_match_query(terms)
+    if not match:
+        return [], False
+
+    sql = (
+        'SELECT search_index.rowid AS rowid, search_index.post_id AS post_id, '
+        'posts.title AS title, posts.team_id AS team_id, teams.name AS team_name, '
+        "snippet(search_index, -1, :start, :end, '…', 16) AS snippet "
+        'FROM search_index '
+        'JOIN posts ON posts.id = search_index.post_id '
+        'JOIN teams ON teams.id = posts.team_id '
+        'WHERE search_index MATCH :match '
+    )
+    params = {
+        'match': match,
+        'start': _HIGHLIGHT_START,
+        'end': _HIGHLIGHT_END,
+        'limit': per_page + 1,
+        'offset': (page - 1) * per_page,
+    }
+    if team_id is not None:
+        sql += 'AND search_index.team_id = :team_id '
+        params['team_id'] = team_id
+    sql += 'ORDER BY bm25(search_index, 4.0, 1.0) LIMIT :limit OFFSET :offset'
+
+    rows = db.session.execute(db.text(sql), params).mappings().all()
+    results = [
+        {
+            'post_id': row['post_id'],
+            'team_id': row['team_id'],
+            'team_name': row['team_name'],
+            'title': row['title'],
+            'is_comment': row['rowid'] % 2 == 1,
+            'snippet': _highlight(row['snippet']),
+        }
+        for row in rows[:per_page]
+    ]
+    return results, len(rows) > per_page
+
+
+def _highlight(snippet):
+    return Markup(
+        str(escape(snippet))
+        .replace(_HIGHLIGHT_START, Markup('<mark>'))
+        .replace(_HIGHLIGHT_END, Markup('</mark>'))
+    )
@@ -0,0 +1,124 @@
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.security import generate_password_hash
+
+from . import db
+from .models import User, Team, Post, Comment, PostVote, CommentVote, rebuild_counters, rebuild_team_stats
+from .passwords import password_hasher
+from .ranking import refresh_hot_scores
+from .search import rebuild_search_index
+
+SEED_PASSWORD = 'password'
+SEED_EPOCH = datetime(2025, 1, 1)
+
+
+def seed_database(users, teams, posts, comments, votes, seed=42, batch_size=5000, log=print):
+    # Generates the same rows for the same arguments and starting ids, using
+    # executemany batches so millions of rows stay in bounded memory.
+    rng = random.Random(seed)
+    password = generate_password_hash(SEED_PASSWORD, method=password_hasher.method)
+
+    user_base = _next_id(User)
+    team_base = _next_id(Team)
+    post_base = _next_id(Post)
+    comment_base = _next_id(Comment)
+    span = timedelta(days=365)
+
+    _insert(User, (
+        {'id': user_base + i, 'username': f'seed{seed}_user{i}', 'email': None, 'password': password}
+        for i in range(users)
+    ), batch_size, log)
+    _insert(Team, (
+        {'id': team_base + i, 'name': f'Seed {seed} Team {i}', 'description': f'Synthetic board {i}'}
+        for i in range(teams)
+    ), batch_size, log)
+
+    def post_time(i):
+        return SEED_EPOCH + span * (i / max(posts, 1))
+
+    def post_rows():
+        for i in range(posts):
+            yield {
+                'id': post_base + i,
+                'title': f'Thread {i}: {_words(rng, 6)}',
+                'content': _words(rng, 40),
+                'timestamp': post_time(i),
+                'user_id': user_base + rng.randrange(users),
+                'team_id': team_base + rng.randrange(teams),
+            }
+
+    _insert(Post, post_rows(), batch_size, log)
+
+    def comment_rows():
+        for i in range(comments):
+            post = rng.randrange(posts)
+            yield {
+                'id': comment_base + i,
+                'content': _words(rng, 20),
+                'timestamp': post_time(post) + timedelta(minutes=rng.randrange(1, 24 * 60)),
+                'user_id': user_base + rng.randrange(users),
+                'post_id': post_base + post,
+            }
+
+    _insert(Comment, comment_rows(), batch_size, log)
+
+    post_votes = votes // 2
+    _insert(PostVote, (
+        {'value': 1, 'user_id': user_base + rng.randrange(users), 'post_id': post_base + rng.randrange(posts)}
+        for _ in range(post_votes)
+    ), batch_size, log, ignore_conflicts=True)
+    if comments:
+        _insert(CommentVote, (
+            {'value': 1, 'user_id': user_base + rng.randrange(users),
+             'comment_id': comment_base + rng.randrange(comments)}
+            for _ in range(votes - post_votes)
+        ), batch_size, log, ignore_conflicts=True)
+
+    log('Rebuilding counters, team stats, hot scores and the search index...')
+    rebuild_counters()
+    rebuild_team_stats()
+    db.session.commit()
+    refresh_hot_scores(window=datetime.utcnow() - SEED_EPOCH, batch_size=batch_size)
+    rebuild_search_index()
+    db.session.commit()
+
+
+def _next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def _insert(model, rows, batch_size, log, ignore_conflicts=False):
+    statement = sqlite_insert(model)
+    if ignore_conflicts:
+        statement = statement.on_conflict_do_nothing()
+
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            total += _flush(statement, batch)
+            batch = []
+    if batch:
+        total += _flush(statement, batch)
+    log(f'{model.__tablename__}: {total} rows')
+
+
+def _flush(statement, batch):
+    db.session.execute(statement, batch)
+    db.session.commit()
+    return len(batch)
+
+
+_VOCABULARY = (
+    'transfer rumour derby penalty offside keeper striker midfield press '
+    'tactics referee var goal assist clean sheet injury loan window manager '
+    'formation counter attack header volley corner freekick table relegation '
+    'promotion cup final semi league title away home fans ultras kit captain'
+).split()
+
+
+def _words(rng, count):
+    return ' '.join(rng.choice(_VOCABULARY) for _ in range(count))
@@ -0,0 +1,15 @@
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+
+
+class RoutingSession(Session):
+    # Sends reads to the replica chosen for the current request (see
+    # replicas.replica_reads). Flushes, and everything outside such a
+    # request, use the normal binds.
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            key = g.get('db_replica')
+            if key is not None:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
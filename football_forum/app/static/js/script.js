@@ -0,0 +1,142 @@
+// Progressive enhancement for post pages: votes and comments are sent with
+// fetch and patched into the page, and other readers' activity streams in
+// over Server-Sent Events. If the request never reaches the server the form
+// is submitted normally, so the page works the same without JavaScript; once
+// the server has answered, a failure is shown instead of resubmitting, since
+// the vote or comment may already have been saved.
+
+class NotSent extends Error {}
+
+const UNKNOWN_OUTCOME = 'Something went wrong. Reload the page to check whether it went through.';
+
+async function postForm(form) {
+    let response;
+    try {
+        response = await fetch(form.action, {
+            method: 'POST',
+            body: new FormData(form),
+            headers: {'Accept': 'application/json'},
+            credentials: 'same-origin',
+        });
+    } catch (error) {
+        // fetch rejects with a TypeError when no response arrived at all.
+        throw error instanceof TypeError ? new NotSent() : error;
+    }
+    const type = response.headers.get('Content-Type') || '';
+    const data = type.includes('application/json') ? await response.json().catch(() => null) : null;
+    if (!response.ok || data === null) {
+        throw new Error((data && data.error) || UNKNOWN_OUTCOME);
+    }
+    return data;
+}
+
+function showError(form, message) {
+    let error = form.previousElementSibling;
+    if (!error || !error.classList.contains('form-error')) {
+        error = document.createElement('div');
+        error.className = 'flash flash-error form-error';
+        form.before(error);
+    }
+    error.textContent = message;
+}
+
+function clearError(form) {
+    const error = form.previousElementSibling;
+    if (error && error.classList.contains('form-error')) {
+        error.remove();
+    }
+}
+
+async function vote(form) {
+    const data = await postForm(form);
+    const score = document.getElementById(form.dataset.score);
+    if (score) {
+        score.textContent = data.vote_score;
+    }
+    const button = form.querySelector('button');
+    button.disabled = true;
+    button.textContent = data.created ? 'Upvoted' : 'Already upvoted';
+}
+
+function appendComment(id, html) {
+    // A comment can arrive both as our own POST response and as a live event.
+    if (document.getElementById('comment-' + id)) {
+        return;
+    }
+    const placeholder = document.getElementById('no-comments');
+    if (placeholder) {
+        placeholder.remove();
+    }
+    document.getElementById('comments').insertAdjacentHTML('beforeend', html);
+}
+
+async function comment(form) {
+    const data = await postForm(form);
+    appendComment(data.id, data.html);
+    form.reset();
+}
+
+function setText(id, value) {
+    const element = document.getElementById(id);
+    if (element) {
+        element.textContent = value;
+    }
+}
+
+function listen(comments) {
+    const events = new EventSource(comments.dataset.events);
+    events.addEventListener('comment', (event) => {
+        const data = JSON.parse(event.data);
+        const anonymous = comments.dataset.viewer === 'anonymous' && data.anonymous_html;
+        appendComment(data.id, anonymous ? data.anonymous_html : data.html);
+    });
+    events.addEventListener('post_score', (event) => {
+        setText('post-score', JSON.parse(event.data).vote_score);
+    });
+    events.addEventListener('comment_score', (event) => {
+        const data = JSON.parse(event.data);
+        setText('comment-' + data.id + '-score', data.vote_score);
+    });
+}
+
+document.addEventListener('submit', (event) => {
+    const form = event.target;
+    let handler = null;
+    if (form.classList.contains('vote-form')) {
+        handler = vote;
+    } else if (form.classList.contains('comment-form')) {
+        if (!form.elements.comment_content.value.trim()) {
+            return;
+        }
+        handler = comment;
+    }
+    if (!handler || !window.fetch) {
+        return;
+    }
+
+    event.preventDefault();
+    const button = form.querySelector('button');
+    button.disabled = true;
+    clearError(form);
+    handler(form)
+        .catch((error) => {
+            if (error instanceof NotSent) {
+                form.submit();
+                return;
+            }
+            showError(form, error.message || UNKNOWN_OUTCOME);
+            button.disabled = false;
+        })
+        .finally(() => {
+            if (form.classList.contains('comment-form')) {
+                button.disabled = false;
+            }
+        });
+});
+
+document.addEventListener('DOMContentLoaded', () => {
+    const comments = document.getElementById('comments');
+    if (comments && comments.dataset.events && window.EventSource) {
+        listen(comments);
+    }
+});
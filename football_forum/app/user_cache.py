@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from . import db
+from .instrumentation import metrics
+
+
+class UserCache:
+    # Bounded LRU of detached User objects for the Flask-Login user_loader.
+    # Entries expire after `ttl` seconds and are dropped when a flush that
+    # touches the user commits.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.enabled = False
+        self.maxsize = 0
+        self.ttl = 0
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        app.config.setdefault('USER_CACHE_ENABLED', True)
+        app.config.setdefault('USER_CACHE_SIZE', 1024)
+        app.config.setdefault('USER_CACHE_TTL', 300)
+
+        self.enabled = app.config['USER_CACHE_ENABLED']
+        self.maxsize = app.config['USER_CACHE_SIZE']
+        self.ttl = app.config['USER_CACHE_TTL']
+        self.clear()
+
+        if not event.contains(db.session, 'after_flush', _collect_changed_users):
+            event.listen(db.session, 'after_flush', _collect_changed_users)
+            event.listen(db.session, 'after_commit', _invalidate_changed_users)
+            event.listen(db.session, 'after_soft_rollback', _discard_changed_users)
+
+    def load(self, user_id):
+        from .models import User
+
+        if not self.enabled:
+            return db.session.get(User, user_id)
+
+        user = self.get(user_id)
+        if user is None:
+            user = db.session.get(User, user_id)
+            if user is not None:
+                db.session.expunge(user)
+                self.set(user)
+        return user
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] < now:
+                self.entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user):
+        with self.lock:
+            self.entries[user.id] = (time.monotonic() + self.ttl, user)
+            self.entries.move_to_end(user.id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def collect(self):
+        with self.lock:
+            return [
+                ('forum_user_cache_hits_total', 'counter', 'User loader cache hits.', [({}, self.hits)]),
+                ('forum_user_cache_misses_total', 'counter', 'User loader cache misses.', [({}, self.misses)]),
+                ('forum_user_cache_entries', 'gauge', 'Users currently cached.', [({}, len(self.entries))]),
+            ]
+
+
+user_cache = UserCache()
+metrics.add_collector(user_cache.collect)
+
+
+def _collect_changed_users(session, flush_context):
+    from .models import User
+
+    changed = session.info.setdefault('changed_user_ids', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+
+
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.invalidate(user_id)
+
+
+def _discard_changed_users(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop('changed_user_ids', None)
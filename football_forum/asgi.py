@@ -0,0 +1,8 @@
+import os
+
+from app import create_app
+from app.asgi import AsyncForum
+
+# Event streams are cheap here, so live updates default to on; an explicit
+# FLASK_LIVE_UPDATES_BACKEND still wins.
+app = AsyncForum(create_app({'LIVE_UPDATES_BACKEND': os.environ.get('FLASK_LIVE_UPDATES_BACKEND', 'memory')}))
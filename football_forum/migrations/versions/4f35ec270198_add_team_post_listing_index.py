@@ -0,0 +1,29 @@
+"""Add team post listing index
+
+Revision ID: 4f35ec270198
+Revises: 5b8a7bc5c703
+Create Date: 2026-10-18 11:03:27.540911
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f35ec270198'
+down_revision = '5b8a7bc5c703'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_posts_team_id_timestamp_id',
+        'posts',
+        ['team_id', sa.text('timestamp DESC'), sa.text('id DESC')],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_posts_team_id_timestamp_id', table_name='posts')
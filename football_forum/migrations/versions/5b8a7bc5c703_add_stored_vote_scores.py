@@ -0,0 +1,37 @@
+"""Add stored vote scores to posts and comments
+
+Revision ID: 5b8a7bc5c703
+Revises: c447612eef95
+Create Date: 2026-10-18 10:12:44.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8a7bc5c703'
+down_revision = 'c447612eef95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('vote_score', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('comments', sa.Column('vote_score', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute(
+        'UPDATE posts SET vote_score = ('
+        'SELECT COALESCE(SUM(value), 0) FROM post_votes WHERE post_votes.post_id = posts.id)'
+    )
+    op.execute(
+        'UPDATE comments SET vote_score = ('
+        'SELECT COALESCE(SUM(value), 0) FROM comment_votes WHERE comment_votes.comment_id = comments.id)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.drop_column('vote_score')
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('vote_score')
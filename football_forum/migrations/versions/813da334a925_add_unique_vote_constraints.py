@@ -0,0 +1,50 @@
+"""Add unique (user, target) constraints to vote tables
+
+Revision ID: 813da334a925
+Revises: 4f35ec270198
+Create Date: 2026-10-18 12:41:09.276415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '813da334a925'
+down_revision = '4f35ec270198'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Drop duplicate votes left behind by the old check-then-insert path
+    # before the constraints can be created, then resync the counters.
+    op.execute(
+        'DELETE FROM post_votes WHERE id NOT IN ('
+        'SELECT MIN(id) FROM post_votes GROUP BY user_id, post_id)'
+    )
+    op.execute(
+        'DELETE FROM comment_votes WHERE id NOT IN ('
+        'SELECT MIN(id) FROM comment_votes GROUP BY user_id, comment_id)'
+    )
+
+    with op.batch_alter_table('post_votes') as batch_op:
+        batch_op.create_unique_constraint('uq_post_votes_user_id_post_id', ['user_id', 'post_id'])
+    with op.batch_alter_table('comment_votes') as batch_op:
+        batch_op.create_unique_constraint('uq_comment_votes_user_id_comment_id', ['user_id', 'comment_id'])
+
+    op.execute(
+        'UPDATE posts SET vote_score = ('
+        'SELECT COALESCE(SUM(value), 0) FROM post_votes WHERE post_votes.post_id = posts.id)'
+    )
+    op.execute(
+        'UPDATE comments SET vote_score = ('
+        'SELECT COALESCE(SUM(value), 0) FROM comment_votes WHERE comment_votes.comment_id = comments.id)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('comment_votes') as batch_op:
+        batch_op.drop_constraint('uq_comment_votes_user_id_comment_id', type_='unique')
+    with op.batch_alter_table('post_votes') as batch_op:
+        batch_op.drop_constraint('uq_post_votes_user_id_post_id', type_='unique')
@@ -0,0 +1,55 @@
+"""Add moderation flags and ON DELETE CASCADE to post children
+
+Revision ID: a4f6d1e83b20
+Revises: e5a0c3b86f14
+Create Date: 2026-10-18 21:17:43.508216
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4f6d1e83b20'
+down_revision = 'e5a0c3b86f14'
+branch_labels = None
+depends_on = None
+
+# The foreign keys were created unnamed; SQLite can only change them by
+# rebuilding the table, which batch mode does once they have a name.
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+CASCADES = (
+    ('comments', 'post_id', 'posts'),
+    ('post_votes', 'post_id', 'posts'),
+    ('comment_votes', 'comment_id', 'comments'),
+    ('timeline_entries', 'post_id', 'posts'),
+)
+
+
+def upgrade():
+    for table, column, referred in CASCADES:
+        name = f'fk_{table}_{column}_{referred}'
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete='CASCADE')
+
+    op.add_column('users', sa.Column('is_moderator', sa.Boolean(), server_default='0', nullable=False))
+    op.add_column('posts', sa.Column('locked', sa.Boolean(), server_default='0', nullable=False))
+    op.create_index('ix_posts_user_id', 'posts', ['user_id'], unique=False)
+    op.create_index('ix_comments_user_id', 'comments', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_comments_user_id', table_name='comments')
+    op.drop_index('ix_posts_user_id', table_name='posts')
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('locked')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('is_moderator')
+
+    for table, column, referred in reversed(CASCADES):
+        name = f'fk_{table}_{column}_{referred}'
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(name, referred, [column], ['id'])
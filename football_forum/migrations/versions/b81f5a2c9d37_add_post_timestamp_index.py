@@ -0,0 +1,29 @@
+"""Add site-wide post timestamp index
+
+Revision ID: b81f5a2c9d37
+Revises: 7c2d9e4f1a86
+Create Date: 2026-10-18 19:31:52.447180
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f5a2c9d37'
+down_revision = '7c2d9e4f1a86'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_posts_timestamp_id',
+        'posts',
+        [sa.text('timestamp DESC'), sa.text('id DESC')],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_posts_timestamp_id', table_name='posts')
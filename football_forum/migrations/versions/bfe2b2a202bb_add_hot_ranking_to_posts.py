@@ -0,0 +1,60 @@
+"""Add comment counts and hot ranking to posts
+
+Revision ID: bfe2b2a202bb
+Revises: d99de9160f70
+Create Date: 2026-10-18 15:20:37.914252
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bfe2b2a202bb'
+down_revision = 'd99de9160f70'
+branch_labels = None
+depends_on = None
+
+
+def _hot_score(vote_score, comment_count, timestamp, now):
+    # Same formula as app.ranking.hot_score at the time of this migration.
+    age_hours = max((now - timestamp).total_seconds() / 3600, 0)
+    return (vote_score + 2 * comment_count + 1) / (age_hours + 2) ** 1.8
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('posts', sa.Column('hot_score', sa.Float(), server_default='0', nullable=False))
+
+    op.execute(
+        'UPDATE posts SET comment_count = ('
+        'SELECT COUNT(*) FROM comments WHERE comments.post_id = posts.id)'
+    )
+
+    bind = op.get_bind()
+    now = datetime.utcnow()
+    rows = bind.execute(sa.text(
+        'SELECT id, vote_score, comment_count, timestamp FROM posts WHERE timestamp IS NOT NULL'
+    )).all()
+    scores = [
+        {'id': id, 'hot_score': _hot_score(votes, comments, datetime.fromisoformat(str(timestamp)), now)}
+        for id, votes, comments, timestamp in rows
+    ]
+    if scores:
+        bind.execute(sa.text('UPDATE posts SET hot_score = :hot_score WHERE id = :id'), scores)
+
+    op.create_index(
+        'ix_posts_team_id_hot_score_id',
+        'posts',
+        ['team_id', sa.text('hot_score DESC'), sa.text('id DESC')],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_posts_team_id_hot_score_id', table_name='posts')
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('hot_score')
+        batch_op.drop_column('comment_count')
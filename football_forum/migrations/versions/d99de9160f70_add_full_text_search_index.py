@@ -0,0 +1,37 @@
+"""Add full-text search index over posts and comments
+
+Revision ID: d99de9160f70
+Revises: 813da334a925
+Create Date: 2026-10-18 13:58:52.601734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd99de9160f70'
+down_revision = '813da334a925'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        'CREATE VIRTUAL TABLE search_index USING fts5('
+        'title, content, post_id UNINDEXED, team_id UNINDEXED, '
+        "tokenize = 'porter unicode61')"
+    )
+    op.execute(
+        'INSERT INTO search_index (rowid, title, content, post_id, team_id) '
+        'SELECT id * 2, title, content, id, team_id FROM posts'
+    )
+    op.execute(
+        'INSERT INTO search_index (rowid, title, content, post_id, team_id) '
+        "SELECT comments.id * 2 + 1, '', comments.content, comments.post_id, posts.team_id "
+        'FROM comments JOIN posts ON posts.id = comments.post_id'
+    )
+
+
+def downgrade():
+    op.execute('DROP TABLE search_index')
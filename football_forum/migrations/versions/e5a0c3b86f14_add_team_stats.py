@@ -0,0 +1,43 @@
+"""Add maintained per-team statistics
+
+Revision ID: e5a0c3b86f14
+Revises: b81f5a2c9d37
+Create Date: 2026-10-18 20:04:27.391845
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a0c3b86f14'
+down_revision = 'b81f5a2c9d37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('team_stats',
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('post_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('last_activity_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.PrimaryKeyConstraint('team_id')
+    )
+    op.execute(
+        'INSERT INTO team_stats (team_id, post_count, comment_count, last_activity_at) '
+        'SELECT teams.id, '
+        '  (SELECT count(*) FROM posts WHERE posts.team_id = teams.id), '
+        '  (SELECT count(*) FROM comments JOIN posts ON posts.id = comments.post_id WHERE posts.team_id = teams.id), '
+        '  (SELECT max(ts) FROM ('
+        '    SELECT max(posts.timestamp) AS ts FROM posts WHERE posts.team_id = teams.id '
+        '    UNION ALL '
+        '    SELECT max(comments.timestamp) FROM comments JOIN posts ON posts.id = comments.post_id '
+        '    WHERE posts.team_id = teams.id)) '
+        'FROM teams'
+    )
+
+
+def downgrade():
+    op.drop_table('team_stats')
@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+from collections import Counter
+
+from flask_migrate import upgrade
+
+from app import create_app, db
+from app.models import User, Team, Post, PostVote
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations')
+WORKERS = 8
+VOTERS = 120
+
+
+def make_app(path):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'SQLITE_PROFILE': 'production',
+        'PASSWORD_HASH_WORKERS': 0,
+        'FRAGMENT_CACHE_BACKEND': 'null',
+    })
+
+
+def upvote(path, user_ids, start, results):
+    # Runs in its own process, like a gunicorn worker: its own app, engine
+    # and connection pool, sharing only the database file.
+    app = make_app(path)
+    client = app.test_client()
+    statuses, errors = Counter(), []
+    start.wait()
+    for user_id in user_ids:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        try:
+            statuses[client.post('/teams/1/post/1/upvote').status_code] += 1
+        except Exception as exc:
+            errors.append(repr(exc))
+    results.put((statuses, errors))
+
+
+def test_upvotes_from_many_processes(tmp_path):
+    path = tmp_path / 'forum.db'
+    app = make_app(path)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        db.session.add_all(User(id=i, username=f'fan{i}', password='x') for i in range(1, VOTERS + 1))
+        db.session.add(Team(id=1, name='Team'))
+        db.session.add(Post(id=1, title='Thread', content='Kick-off', user_id=1, team_id=1))
+        db.session.commit()
+        db.engine.dispose()
+
+    # Every voter votes twice, from two different processes, so the
+    # duplicate has to be caught by the database rather than by luck.
+    voters = list(range(1, VOTERS + 1))
+    ballots = voters + voters[::-1]
+    ctx = multiprocessing.get_context('spawn')
+    start = ctx.Barrier(WORKERS)
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=upvote, args=(str(path), ballots[i::WORKERS], start, results))
+        for i in range(WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get(timeout=120) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    statuses, errors = Counter(), []
+    for worker_statuses, worker_errors in outcomes:
+        statuses.update(worker_statuses)
+        errors += worker_errors
+    assert errors == []
+    assert statuses == {302: len(ballots)}
+
+    with app.app_context():
+        assert db.session.get(Post, 1).vote_score == VOTERS
+        assert db.session.scalar(db.select(db.func.count(PostVote.id))) == VOTERS
@@ -0,0 +1,82 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from flask_migrate import upgrade
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, Team, Post, Comment, rebuild_counters, rebuild_team_stats
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations')
+N = 20
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "forum.db"}',
+        'PASSWORD_HASH_WORKERS': 0,
+        'FRAGMENT_CACHE_BACKEND': 'null',
+    })
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def seed(app, count):
+    with app.app_context():
+        if db.session.get(Post, 1) is None:
+            db.session.add(User(id=1, username='fan', password='x'))
+            db.session.add(Team(id=1, name='Team'))
+            db.session.add(Post(id=1, title='Thread', content='Kick-off', user_id=1, team_id=1))
+        start = db.session.scalar(db.select(db.func.count(Comment.id)))
+        now = datetime.utcnow()
+        # One author per comment, so a lazy load per row can't hide behind
+        # the identity map.
+        db.session.add_all(User(id=i + 2, username=f'fan{i}', password='x') for i in range(start, count))
+        db.session.add_all(
+            Comment(content=f'Comment {i}', user_id=i + 2, post_id=1, timestamp=now + timedelta(seconds=i))
+            for i in range(start, count)
+        )
+        db.session.flush()
+        rebuild_counters()
+        rebuild_team_stats()
+        db.session.commit()
+
+
+def statements(app, url):
+    count = 0
+
+    def on_execute(*args):
+        nonlocal count
+        count += 1
+
+    client = app.test_client()
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', on_execute)
+    try:
+        response = client.get(url)
+        response.get_data()
+    finally:
+        event.remove(engine, 'before_cursor_execute', on_execute)
+    assert response.status_code == 200
+    return count
+
+
+# A threshold of 1 streams every thread page; 0 never does.
+@pytest.mark.parametrize('url, stream_threshold', [
+    ('/teams/1/post/1', 0),
+    ('/teams/1/post/1', 1),
+    ('/teams/1', 0),
+])
+def test_statement_count_does_not_grow_with_comments(app, url, stream_threshold):
+    app.config['STREAM_COMMENTS_THRESHOLD'] = stream_threshold
+    seed(app, N)
+    small = statements(app, url)
+    seed(app, 5 * N)
+    assert statements(app, url) == small